@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 from flask import Flask, render_template, request, flash
-from flask import url_for, session, redirect
+from flask import url_for, session, redirect, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from application.models.service_vendor import ServiceVendor
+from application.models.circuit_breaker import CircuitOpenError
+from application.models.vend_jobs import get_job_queue, VendWorkerPool
+from application.models.vend_jobs import DuplicateTransactionError
 from paypal_handler import PayPalHandler
 from credentials import PAYPAL_MODE, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET
 import secrets
+import math
 import os
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 from application.models.registration import RegistrationManager
-from db_handler import Database
+from application.models.rate_limiter import get_login_throttle
+from application.models.email_filter import get_email_filter
+import db_pool
 from application.routes.account_recovery import password_reset_bp
+from application.routes.vendor_callback import vendor_callback_bp
 
 # Load environment variables from .env
 load_dotenv()
@@ -23,12 +32,38 @@ if not PAYPAL_CLIENT_ID or not PAYPAL_CLIENT_SECRET:
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 app.secret_key = secrets.token_hex(32)  # Generate a random secret key
 
+# Reverse proxies in front of the app. Behind them request.remote_addr is
+# the proxy's address, so the client's is taken from X-Forwarded-For; only
+# that many hops are trusted, since a client can send the header too.
+trusted_proxy_hops = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if trusted_proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxy_hops,
+                            x_proto=trusted_proxy_hops)
+
 app.register_blueprint(password_reset_bp)
 
+# Borrow pooled database connections per request
+db_pool.init_app(app)
+
+# Vendor callbacks are only accepted when they can be authenticated.
+if os.getenv("VEND_CALLBACK_SECRET"):
+    app.register_blueprint(vendor_callback_bp)
+
 base_url = os.getenv("AIRTIME_BASE_URL")
 api_key = os.getenv("api_key")
 api_secret = os.getenv("api_secret")
 
+# Public URL of the vend_callback route. When set, it is sent to the vendor
+# instead of the callback value returned by vend validation, with the
+# callback secret as its token parameter so the vendor's calls authenticate.
+vend_callback_url = os.getenv("VEND_CALLBACK_URL")
+if vend_callback_url:
+    if not os.getenv("VEND_CALLBACK_SECRET"):
+        raise ValueError("VEND_CALLBACK_URL is set but VEND_CALLBACK_SECRET "
+                         "is not. Set the secret shared with the vendor.")
+    vend_callback_url += ("&" if "?" in vend_callback_url else "?") + \
+        urlencode({"token": os.getenv("VEND_CALLBACK_SECRET")})
+
 vertical_id = "airtime"
 
 # Create instances of ServiceVendor and PayPalHandler
@@ -38,11 +73,24 @@ paypal_handler = PayPalHandler(
     PAYPAL_CLIENT_ID,
     PAYPAL_CLIENT_SECRET
 )
-# Initialize the database connection
-db = Database()
 
-# Create an instance of RegistrationManager with app and db
+# Vends run in background workers once the PayPal payment is captured
+vend_jobs = get_job_queue()
+vend_workers = VendWorkerPool(vend_jobs, airtime)
+# One RegistrationManager serves every request; it borrows pooled
+# connections per call
 registration_manager = RegistrationManager(app)
+# Throttles /login per email and client IP before any DB or bcrypt work
+login_throttle = get_login_throttle()
+# Registered emails, so lookups of unknown ones skip the database
+email_filter = get_email_filter()
+
+
+@app.before_request
+def start_vend_workers():
+    """Start the background threads in this process if not yet running."""
+    vend_workers.ensure_started()
+    email_filter.ensure_started()
 
 # Home route
 
@@ -113,7 +161,7 @@ def vend_airtime():
 
             # Perform vend validation
             validate_response = airtime.vend_validate(
-                vertical_id, customer_account_number)
+                vertical_id, customer_account_number, use_cache=False)
 
             # Extract necessary information for PayPal payment
             trx_id = validate_response.get("data", {}).get("trxId", "")
@@ -123,7 +171,8 @@ def vend_airtime():
                     {}])[0].get(
                 "id", "")
             deliver_to = validate_response.get("data", {}).get("deliverTo", "")
-            callback = validate_response.get("data", {}).get("callback", "")
+            callback = vend_callback_url or validate_response.get(
+                "data", {}).get("callback", "")
 
             # Save necessary information in session for later use in the
             # execute route
@@ -178,7 +227,7 @@ def vend_electricity():
 
         # Perform vend validation
         validate_response = airtime.vend_validate(
-            vertical_id, customer_account_number)
+            vertical_id, customer_account_number, use_cache=False)
 
         # Extract necessary information for PayPal payment
         trx_id = validate_response.get("data", {}).get("trxId", "")
@@ -188,7 +237,8 @@ def vend_electricity():
                 {}])[0].get(
                 "id", "")
         deliver_to = validate_response.get("data", {}).get("deliverTo", "")
-        callback = validate_response.get("data", {}).get("callback", "")
+        callback = vend_callback_url or validate_response.get(
+            "data", {}).get("callback", "")
 
         # Save necessary information in session for later use in the execute
         # route
@@ -238,7 +288,7 @@ def pay_tv():
 
         # Perform vend validation
         validate_response = airtime.vend_validate(
-            vertical_id, customer_account_number)
+            vertical_id, customer_account_number, use_cache=False)
 
         # Extract necessary information for PayPal payment
         trx_id = validate_response.get("data", {}).get("trxId", "")
@@ -248,7 +298,8 @@ def pay_tv():
                 {}])[0].get(
                 "id", "")
         deliver_to = validate_response.get("data", {}).get("deliverTo", "")
-        callback = validate_response.get("data", {}).get("callback", "")
+        callback = vend_callback_url or validate_response.get(
+            "data", {}).get("callback", "")
 
         # Save necessary information in session for later use in the execute
         # route
@@ -309,14 +360,16 @@ def complete_transaction():
 @app.route('/execute_payment', methods=['GET', 'POST'])
 def execute_payment():
     """
-    Handle the execution of a payment and vend operation.
+    Handle the execution of a payment and queue the vend operation.
 
     Retrieves necessary information from the session, including transaction
-    details, executes the PayPal payment, and performs vend execution based on
-    the transaction information.
+    details, and executes the PayPal payment. The vend execution is queued
+    for the background workers, and the user is sent to a status page that
+    follows it, so the request does not wait for the vending API.
 
     Returns:
-    - render_template: Success or error template based on the execution result.
+    - redirect: Redirects to the vend status page once payment succeeded.
+    - render_template: Error template if the payment failed.
     """
     # Retrieve necessary information from session
     transaction_info = session.get('transaction_info')
@@ -326,42 +379,82 @@ def execute_payment():
             'error.html',
             error_message='Transaction information not found in session.')
 
-    # Extract necessary information for vend execution
-    trx_id = transaction_info['trx_id']
-    customer_account_number = transaction_info['customer_account_number']
-    usd_amount = transaction_info['usd_amount']
-    vertical_id = transaction_info['vertical_id']
-    delivery_method = transaction_info['delivery_method']
-    deliver_to = transaction_info['deliver_to']
-    callback = transaction_info['callback']
-
-    print(f"trx_id: {trx_id}")
-    print(f"delivery_method: {delivery_method}")
+    print(f"trx_id: {transaction_info['trx_id']}")
+    print(f"delivery_method: {transaction_info['delivery_method']}")
 
     # Execute the PayPal payment
+    payment_id = request.args.get('paymentId')
     success, error_message = paypal_handler.execute_payment(
-        request.args.get('paymentId'), request.args.get('PayerID'))
+        payment_id, request.args.get('PayerID'))
 
     if success:
-        # Perform vend execution with the retrieved information
-        execute_response = airtime.vend_execute(
-            trx_id,
-            customer_account_number,
-            usd_amount,
-            vertical_id,
-            delivery_method,
-            deliver_to,
-            callback)
-        print(f"execute_response: {execute_response}")
-
-        return render_template(
-            'success.html',
-            execute_response=execute_response)
+        # Queue the vend execution with the retrieved information
+        try:
+            job_id = vend_jobs.enqueue(
+                dict(transaction_info, payment_id=payment_id))
+        except DuplicateTransactionError as e:
+            print(f"Error: {str(e)} Payment {payment_id} was not vended.")
+            return render_template(
+                'error.html',
+                error_message='This transaction was already used for '
+                'another payment. Please contact support for a refund.')
+        vend_workers.notify()
+
+        return redirect(url_for('vend_status', job_id=job_id))
     else:
         # Handle payment execution failure
         return render_template('error.html', error_message=error_message)
 
 
+@app.route('/vend_status/<job_id>')
+def vend_status(job_id):
+    """
+    Render the page that follows a queued vend until it completes.
+
+    Args:
+        job_id (str): The id of the queued vend.
+
+    Returns:
+    - render_template: The status page, or an error page for unknown ids.
+    """
+    job = vend_jobs.get(job_id)
+    if job is None:
+        return render_template(
+            'error.html', error_message='Transaction not found.'), 404
+    return render_template('vend_status.html', job=job)
+
+
+@app.route('/vend_status/<job_id>/poll')
+def poll_vend_status(job_id):
+    """
+    Return the status of a queued vend as JSON for the status page.
+
+    Args:
+        job_id (str): The id of the queued vend.
+
+    Returns:
+    - Response: The job status, or 404 for unknown ids.
+    """
+    job = vend_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Transaction not found.'}), 404
+    return jsonify({
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'response': job['response'],
+        'delivery_status': job['delivery_status'],
+    })
+
+
+@app.errorhandler(CircuitOpenError)
+def vendor_unavailable(error):
+    """Fail fast with a 503 while the vending API circuit is open."""
+    return render_template(
+        'error.html',
+        error_message='The service provider is temporarily unavailable.'
+    ), 503
+
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     """Handle user registration requests."""
@@ -374,8 +467,6 @@ def register():
         password = request.form['password']
 
         # Use the RegistrationManager to register the user
-        registration_manager = RegistrationManager(
-            app)  # Pass your Flask app and db object
         result = registration_manager.register_user(
             first_name, last_name, email, phone, password)
 
@@ -384,9 +475,6 @@ def register():
         else:
             flash('Registration failed. Please try again.', 'danger')
 
-        # Close the database connection
-        registration_manager.close_database_connection()
-
     return render_template('register.html')
 
 
@@ -398,12 +486,15 @@ def login():
         email = request.form['email']
         password = request.form['password']
 
-        # Print the email and password to check if they are received correctly
+        # Print the email to check if it is received correctly
         print(f"Received email: {email}")
-        print(f"Received password: {password}")
 
-        # Use the RegistrationManager to authenticate the user
-        registration_manager = RegistrationManager(app)
+        # Turn away bursts before they reach the database or bcrypt
+        retry_after = login_throttle.check(email, request.remote_addr)
+        if retry_after:
+            flash('Too many login attempts. Please try again in '
+                  f'{math.ceil(retry_after)} seconds.', 'danger')
+            return render_template('login.html'), 429
 
         # Print messages for debugging
         print("Before login attempt")
@@ -421,9 +512,6 @@ def login():
                   'danger'
                   )
 
-        # Close the database connection
-        registration_manager.close_database_connection()
-
     return render_template('login.html')
 
 
@@ -1,7 +1,8 @@
 """This module deals with the generation of the access token."""
-import requests
 import os
 from dotenv import load_dotenv
+from .http_session import get_session, default_timeout
+from .circuit_breaker import get_breaker, guarded_request
 
 # Load environment variables from .env
 load_dotenv()
@@ -11,20 +12,19 @@ api_key = os.getenv("api_key")
 api_secret = os.getenv("api_secret")
 
 
-def get_token():
-    """Generate access token.
+def fetch_token():
+    """Request a new access token together with its lifetime.
 
     Description:
-                This function generates the access token which is needed
-                during the authentication of the transaction.
-
-                I chose this approach so that every time a transaction is
-                initiated, a new token will be generated and used for this
-                particular transaction. this will insure that the each
-                transaction is unique it its own way and no security threats.
+                This function calls the /auth endpoint with the api_key and
+                secret from the environment and returns the access token and
+                the number of seconds it stays valid, as reported by the
+                vendor (expiresIn). When the vendor does not report a
+                lifetime, the second value is None.
 
-                We need the api_key and secret to generate the token.
-                These values are in the environment variable.
+    Returns:
+                tuple: (access_token, expires_in). access_token is None when
+                       the request failed.
     """
     url = f'{base_url}/auth'
     headers = {'Content-Type': 'application/json'}
@@ -33,23 +33,45 @@ def get_token():
         "api_secret": api_secret
     }
 
-    # Make the POST request
-    response = requests.post(url, headers=headers, json=data)
+    # Make the POST request through the auth circuit breaker
+    response = guarded_request(
+        get_breaker("auth"), get_session(), "POST", url, default_timeout(),
+        headers=headers, json=data)
 
     # Check if the request was successful (status code 200)
     if response.status_code == 200:
         # Parse the JSON response
         json_response = response.json()
+        token_data = json_response.get('data', {})
 
-        # Extract the access token from the response
-        access_token = json_response.get('data', {}).get('accessToken')
+        # Extract the access token and its lifetime from the response
+        access_token = token_data.get('accessToken')
+        expires_in = token_data.get('expiresIn')
 
-        # Print the access token
-        # print(f"Access Token: {access_token}")
-        return access_token
+        return access_token, float(expires_in) if expires_in else None
     else:
         print(f"Failed to obtain access token. Status code: "
               f"{response.status_code}, Response: {response.text}")
+        return None, None
+
+
+def get_token():
+    """Generate access token.
+
+    Description:
+                This function generates the access token which is needed
+                during the authentication of the transaction.
+
+                Every call goes to the vendor's /auth endpoint. Callers on
+                the vend path should go through the shared TokenManager
+                (see token_manager.py), which caches the token until it
+                is about to expire.
+
+                We need the api_key and secret to generate the token.
+                These values are in the environment variable.
+    """
+    access_token, _ = fetch_token()
+    return access_token
 
 
 if __name__ == '__main__':
@@ -0,0 +1,275 @@
+import asyncio
+import time
+import aiohttp
+from .token_manager import get_token_manager
+from .http_session import CONNECT_TIMEOUT, READ_TIMEOUT, POOL_MAXSIZE
+from .service_vendor import ValidationResult
+from .circuit_breaker import get_breaker
+
+
+class AsyncServiceVendor:
+    """
+    An asyncio client for the vending API.
+
+    It mirrors ServiceVendor, but vend_validate and vend_execute are
+    coroutines running on a pooled aiohttp connector, so one event loop can
+    keep many vendor calls in flight without a thread per call. The access
+    token comes from the same TokenManager as ServiceVendor.
+    """
+
+    def __init__(self, base_url, api_key, api_secret, token_manager=None,
+                 limit=POOL_MAXSIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT):
+        """
+        Initialize the AsyncServiceVendor instance.
+
+        Parameters:
+        - base_url (str): The base URL of the vending API.
+        - api_key (str): The API key used for authentication.
+        - api_secret (str): The API secret used for authentication.
+        - token_manager (TokenManager): The cache the access token is taken
+                from. Defaults to the process-wide token manager.
+        - limit (int): Maximum number of simultaneous connections.
+        - connect_timeout (float): Seconds to wait for a connection.
+        - read_timeout (float): Seconds to wait for the response.
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.token_manager = (token_manager if token_manager is not None
+                              else get_token_manager())
+        self.limit = limit
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout)
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        """
+        Return the aiohttp session, creating it inside the running loop.
+
+        Returns:
+        - aiohttp.ClientSession: The pooled session.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit)
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def close(self):
+        """
+        Close the pooled connections.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def generate_access_token(self):
+        """
+        Return a valid access token from the shared token cache.
+
+        The cached token is returned without leaving the event loop; only
+        a refresh, which blocks on /auth, runs in the default executor.
+
+        Returns:
+        - str: The obtained access token.
+        """
+        token = self.token_manager.cached_token()
+        if token:
+            return token
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.token_manager.get_token)
+
+    async def perform_authenticated_request(self, url, method="GET",
+                                            data=None, endpoint=None):
+        """
+        Perform an authenticated request to the API.
+
+        Requests go through the same per-endpoint circuit breakers as
+        ServiceVendor and fail fast with CircuitOpenError while the vendor
+        is unhealthy.
+
+        Parameters:
+        - url (str): The URL for the request.
+        - method (str): The HTTP method (GET or POST).
+        - data (dict): The request payload for POST requests.
+        - endpoint (str): The circuit breaker name. Defaults to the last
+                segment of the URL.
+
+        Returns:
+        - dict: The JSON response from the API.
+        """
+        if method not in ("GET", "POST"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        breaker = get_breaker(endpoint or url.rstrip("/").rsplit("/", 1)[-1])
+        breaker.check()
+        session = self._get_session()
+        access_token = await self.generate_access_token()
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {access_token}",
+        }
+
+        status, body = await self._send(
+            breaker, session, method, url, headers, data)
+        if status == 401:
+            # Drop the rejected token; concurrent 401s share one refresh.
+            self.token_manager.invalidate(access_token)
+            access_token = await self.generate_access_token()
+            headers["Authorization"] = f"Bearer {access_token}"
+            status, body = await self._send(
+                breaker, session, method, url, headers, data)
+        return body
+
+    async def _send(self, breaker, session, method, url, headers, data):
+        """Send one request through the breaker; return (status, json)."""
+        breaker.before_request()
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.timeout.sock_connect,
+            sock_read=breaker.read_timeout(self.timeout.sock_read))
+        start = time.monotonic()
+        try:
+            async with session.request(
+                    method, url, headers=headers, json=data,
+                    timeout=timeout) as response:
+                status = response.status
+                body = (await response.json(content_type=None)
+                        if status != 401 else None)
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by wait_for in vend_validate_many. Without
+            # this a half-open breaker would keep its probe forever.
+            breaker.release_probe()
+            raise
+        if status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success(time.monotonic() - start)
+        return status, body
+
+    async def vend_validate(self, vertical_id, customer_account_number):
+        """
+        Perform vend validation.
+
+        Parameters:
+        - vertical_id (str): The service/product vertical unique identifier.
+        - customer_account_number (str): The account number for the customer.
+
+        Returns:
+        - dict: The JSON response from the vend validation.
+        """
+        url = f"{self.base_url}/vend/validate"
+        data = {
+            "verticalId": vertical_id,
+            "customerAccountNumber": customer_account_number,
+        }
+
+        return await self.perform_authenticated_request(
+            url, method="POST", data=data, endpoint="validate")
+
+    async def vend_validate_many(self, accounts, max_concurrency=32,
+                                 timeout=None):
+        """
+        Validate many accounts concurrently, yielding results as they finish.
+
+        At most max_concurrency validations are in flight, and the input is
+        consumed lazily, so arbitrarily long batches use bounded memory.
+        A failing item is reported in its own result and does not stop the
+        rest of the batch.
+
+        Parameters:
+        - accounts (iterable): (vertical_id, customer_account_number) pairs.
+        - max_concurrency (int): Maximum number of in-flight validations.
+        - timeout (float): Overall time limit in seconds for each item.
+
+        Yields:
+        - ValidationResult: One result per input pair, in completion order.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        pairs = iter(accounts)
+        pending = set()
+
+        def submit_next():
+            for vertical_id, customer_account_number in pairs:
+                pending.add(asyncio.ensure_future(self._validate_one(
+                    vertical_id, customer_account_number, timeout)))
+                return True
+            return False
+
+        try:
+            while len(pending) < max_concurrency and submit_next():
+                pass
+
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    submit_next()
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _validate_one(self, vertical_id, customer_account_number,
+                            timeout):
+        """Validate one account of a batch, capturing any error."""
+        try:
+            response = await asyncio.wait_for(
+                self.vend_validate(vertical_id, customer_account_number),
+                timeout)
+            return ValidationResult(
+                vertical_id, customer_account_number, response, None)
+        except Exception as e:
+            return ValidationResult(
+                vertical_id, customer_account_number, None, e)
+
+    async def vend_execute(
+            self,
+            trx_id,
+            customer_account_number,
+            amount,
+            vertical_id,
+            delivery_method,
+            deliver_to,
+            callback):
+        """
+        Perform vend execution.
+
+        Parameters:
+        - trx_id (str): The transaction ID from the vend validation response.
+        - customer_account_number (str): The account number for the customer.
+        - amount (float): The transaction amount.
+        - vertical_id (str): The service/product vertical unique identifier.
+        - delivery_method (str): The delivery method for the transaction.
+        - deliver_to (str): The delivery destination for the transaction.
+        - callback (str): The callback URL for asynchronous processing.
+
+        Returns:
+        - dict: The JSON response from the vend execution.
+        """
+        url = f"{self.base_url}/vend/execute"
+        data = {
+            "trxId": trx_id,
+            "customerAccountNumber": customer_account_number,
+            "amount": amount,
+            "verticalId": vertical_id,
+            "deliveryMethodId": delivery_method,
+            "deliverTo": deliver_to,
+            "callBack": callback,
+        }
+
+        return await self.perform_authenticated_request(
+            url, method="POST", data=data, endpoint="execute")
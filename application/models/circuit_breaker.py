@@ -0,0 +1,287 @@
+"""This module protects the app from a slow or failing vending API."""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# Consecutive failures after which an endpoint's circuit opens.
+FAILURE_THRESHOLD = int(os.getenv("VENDOR_BREAKER_FAILURES", "5"))
+# Seconds an open circuit waits before letting a probe request through.
+RECOVERY_TIMEOUT = float(os.getenv("VENDOR_BREAKER_RECOVERY", "30"))
+# Latency percentile and multiplier used to derive the read timeout.
+TIMEOUT_PERCENTILE = float(os.getenv("VENDOR_TIMEOUT_PERCENTILE", "99"))
+TIMEOUT_MULTIPLIER = float(os.getenv("VENDOR_TIMEOUT_MULTIPLIER", "2"))
+# Lower bound in seconds for the derived read timeout.
+MIN_READ_TIMEOUT = float(os.getenv("VENDOR_MIN_READ_TIMEOUT", "2"))
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the circuit is open."""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(
+            f"The vendor '{name}' endpoint is unavailable; "
+            f"retry in {retry_after:.0f}s.")
+
+
+class LatencyTracker:
+    """
+    Keep recent request latencies and derive a timeout from them.
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        Initialize the tracker.
+
+        Parameters:
+        - window (int): The number of most recent latencies kept.
+        - min_samples (int): Samples needed before percentiles are trusted.
+        """
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Record the latency of a completed request.
+
+        Parameters:
+        - seconds (float): The request latency.
+        """
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent):
+        """
+        Return a latency percentile of the recent window.
+
+        Parameters:
+        - percent (float): The percentile, between 0 and 100.
+
+        Returns:
+        - float: The latency in seconds, or None without enough samples.
+        """
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1,
+                    max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    A per-endpoint circuit breaker with half-open probing.
+
+    The circuit opens after failure_threshold consecutive failures and
+    refuses requests for recovery_timeout seconds. It then lets a single
+    probe through (half-open); the probe's outcome closes or re-opens it.
+    The breaker also tracks latencies so the read timeout can follow the
+    endpoint's recent behaviour instead of a fixed value.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD,
+                 recovery_timeout=RECOVERY_TIMEOUT,
+                 timeout_percentile=TIMEOUT_PERCENTILE,
+                 timeout_multiplier=TIMEOUT_MULTIPLIER,
+                 min_read_timeout=MIN_READ_TIMEOUT):
+        """
+        Initialize the breaker.
+
+        Parameters:
+        - name (str): The endpoint name (validate, execute or auth).
+        - failure_threshold (int): Consecutive failures that open it.
+        - recovery_timeout (float): Seconds to stay open before probing.
+        - timeout_percentile (float): Latency percentile used for timeouts.
+        - timeout_multiplier (float): Headroom applied to that percentile.
+        - min_read_timeout (float): Lower bound for the derived timeout.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_read_timeout = min_read_timeout
+        self.latencies = LatencyTracker()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        Fail fast if the circuit is open, without claiming the probe.
+
+        Raises:
+        - CircuitOpenError: If the circuit is open and still cooling down.
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and elapsed < self.recovery_timeout:
+                raise CircuitOpenError(
+                    self.name, self.recovery_timeout - elapsed)
+
+    def before_request(self):
+        """
+        Check that a request may be sent.
+
+        Raises:
+        - CircuitOpenError: If the circuit is open, or half-open with its
+                probe already in flight.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and elapsed >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(
+                self.name, max(0, self.recovery_timeout - elapsed))
+
+    def record_success(self, seconds):
+        """
+        Record a request the endpoint answered.
+
+        Parameters:
+        - seconds (float): The request latency.
+        """
+        self.latencies.record(seconds)
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """
+        Record a request that failed (connection error, timeout or 5xx).
+        """
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """
+        Give back the half-open probe of a request that never finished.
+
+        Used when a request is cancelled or interrupted: it says nothing
+        about the endpoint, so no outcome is recorded, but the next request
+        must be free to probe.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def read_timeout(self, default):
+        """
+        Return the read timeout to use for the next request.
+
+        Parameters:
+        - default (float): The configured read timeout, used as the upper
+                bound and when there are not enough samples yet.
+
+        Returns:
+        - float: The read timeout in seconds.
+        """
+        latency = self.latencies.percentile(self.timeout_percentile)
+        if latency is None:
+            return default
+        adaptive = latency * self.timeout_multiplier
+        return min(default, max(self.min_read_timeout, adaptive))
+
+    def stats(self):
+        """
+        Return the breaker state for monitoring.
+
+        Returns:
+        - dict: The state, consecutive failures and latency percentiles.
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "p50": self.latencies.percentile(50),
+            "p99": self.latencies.percentile(99),
+        }
+
+
+def guarded_request(breaker, session, method, url, timeout, **kwargs):
+    """
+    Send an HTTP request through a circuit breaker.
+
+    The read timeout is tightened to the breaker's adaptive timeout, and
+    connection errors, timeouts and 5xx responses count as failures.
+
+    Parameters:
+    - breaker (CircuitBreaker): The breaker of the endpoint.
+    - session (requests.Session): The session to send the request on.
+    - method (str): The HTTP method.
+    - url (str): The URL for the request.
+    - timeout (tuple): The configured (connect, read) timeout.
+    - **kwargs: Passed on to session.request.
+
+    Returns:
+    - requests.Response: The response.
+
+    Raises:
+    - CircuitOpenError: If the circuit refuses the request.
+    """
+    breaker.before_request()
+    connect_timeout, read_timeout = timeout
+    start = time.monotonic()
+    try:
+        response = session.request(
+            method, url,
+            timeout=(connect_timeout, breaker.read_timeout(read_timeout)),
+            **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Interrupted, e.g. KeyboardInterrupt: never keep the probe.
+        breaker.release_probe()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success(time.monotonic() - start)
+    return response
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Return the process-wide breaker for an endpoint, creating it if needed.
+
+    Parameters:
+    - name (str): The endpoint name (validate, execute or auth).
+
+    Returns:
+    - CircuitBreaker: The shared breaker.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
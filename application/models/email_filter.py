@@ -0,0 +1,408 @@
+"""This module answers "is this email registered?" without a query."""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from db_handler import Database
+from db_pool import get_pool
+
+# Load environment variables from .env
+load_dotenv()
+
+# Emails the filter is sized for before it is rebuilt larger.
+EMAIL_FILTER_CAPACITY = int(os.getenv("EMAIL_FILTER_CAPACITY", "100000"))
+# Share of unknown emails that still fall through to the database.
+EMAIL_FILTER_ERROR_RATE = float(os.getenv("EMAIL_FILTER_ERROR_RATE", "0.01"))
+# File holding the filter, shared by all workers of a host.
+EMAIL_FILTER_FILE = os.getenv("EMAIL_FILTER_FILE", "email_filter.bin")
+# Seconds between picking up users written outside this module.
+EMAIL_FILTER_REFRESH = float(os.getenv("EMAIL_FILTER_REFRESH", "60"))
+# Seconds after which the filter is rebuilt from scratch regardless.
+EMAIL_FILTER_REBUILD = float(os.getenv("EMAIL_FILTER_REBUILD", "3600"))
+
+
+def normalize_email(email):
+    """
+    Reduce an email to the form the filter stores.
+
+    The users table compares emails with the default utf8mb4_general_ci
+    collation: case-insensitively, ignoring accents, and with "ß" equal
+    to "s". The filter folds the same way; otherwise an address the
+    database would match could be reported as missing. (casefold() is
+    not used: it turns "ß" into "ss", which the database does not.)
+
+    Args:
+        email (str): The email address.
+
+    Returns:
+        str: The normalized address.
+    """
+    decomposed = unicodedata.normalize("NFKD", (email or "").strip())
+    stripped = "".join(char for char in decomposed
+                       if not unicodedata.combining(char))
+    return stripped.lower().replace("ß", "s")
+
+
+class BloomFilter:
+    """
+    A fixed-size set that may report false positives but never false
+    negatives, stored in a byte buffer owned by the caller.
+
+    Attributes:
+        bits (int): The number of bits in the filter.
+        hashes (int): The number of bits set per item.
+    """
+
+    def __init__(self, array, bits, hashes, offset=0):
+        """
+        Initialize a filter over existing bits.
+
+        Args:
+            array (bytearray or mmap): The buffer holding the bits.
+            bits (int): The number of bits in the filter.
+            hashes (int): The number of bits set per item.
+            offset (int): Where the bits start in the buffer.
+        """
+        self.bits = bits
+        self.hashes = hashes
+        self._array = array
+        self._offset = offset
+
+    @staticmethod
+    def size_for(capacity, error_rate):
+        """
+        Size a filter.
+
+        Args:
+            capacity (int): The number of items it is sized for.
+            error_rate (float): The false positive rate at capacity.
+
+        Returns:
+            tuple: (bits, hashes).
+        """
+        capacity = max(1, capacity)
+        bits = max(8, int(-capacity * math.log(error_rate)
+                          / math.log(2) ** 2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return bits, hashes
+
+    def _positions(self, item):
+        """Yield the bit positions of an item (double hashing)."""
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.bits
+
+    def add(self, item):
+        """
+        Add an item.
+
+        Args:
+            item (str): The item to add.
+        """
+        for position in self._positions(item):
+            self._array[self._offset + (position >> 3)] |= (
+                1 << (position & 7))
+
+    def __contains__(self, item):
+        return all(self._array[self._offset + (position >> 3)]
+                   & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class EmailFilter:
+    """
+    A Bloom filter of registered emails, shared by every process of a host.
+
+    The bits live in a memory-mapped file (EMAIL_FILTER_FILE), so an email
+    added by one gunicorn worker, or by a bulk import, is seen by all the
+    others at once. Writers take an exclusive lock on the file; readers do
+    not, since bits only ever go from 0 to 1.
+
+    A background thread in each process refreshes the file when it starts
+    and then every EMAIL_FILTER_REFRESH seconds: it adds users with a
+    higher id, which picks up rows written without going through this
+    module. The file is rebuilt from the table instead when it is missing,
+    full, older than EMAIL_FILTER_REBUILD seconds, or out of step with the
+    table: the number of users with an id up to the highest one loaded
+    must equal the number of rows loaded. That catches a file left from
+    another or a restored database, and rows that committed out of id
+    order. Until the first build completes, and while a rebuild runs,
+    every email is reported as possibly present. Deleted users stay in the
+    filter until the next rebuild and simply cost a query.
+
+    Header generation: it is odd while the bits are being rebuilt, and a
+    lookup that sees it change answers "possibly present".
+    """
+
+    # magic, generation, bits, hashes, capacity, count, max_id, rows loaded
+    # from the table, built_at
+    HEADER = struct.Struct("<8sQQQQQQQQ")
+    MAGIC = b"EMLFLT02"
+
+    def __init__(self, path=EMAIL_FILTER_FILE,
+                 capacity=EMAIL_FILTER_CAPACITY,
+                 error_rate=EMAIL_FILTER_ERROR_RATE,
+                 refresh_interval=EMAIL_FILTER_REFRESH,
+                 rebuild_interval=EMAIL_FILTER_REBUILD):
+        """
+        Initialize the filter. Nothing is loaded until started.
+
+        Args:
+            path (str): The file shared by the processes of this host.
+            capacity (int): The number of emails to size the filter for.
+            error_rate (float): The false positive rate at capacity.
+            refresh_interval (float): Seconds between incremental loads.
+            rebuild_interval (float): Seconds between full rebuilds.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._fd = None
+        self._map = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._started_pid = None
+
+    @property
+    def ready(self):
+        """True once the shared filter has been built."""
+        header = self._header(self._mapping())
+        return header[2] > 0 and header[1] % 2 == 0
+
+    def _descriptor(self):
+        """Return this process's descriptor of the file."""
+        # An inherited descriptor shares its flock with the parent.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR,
+                                       0o600)
+                    self._map = None
+                    self._pid = pid
+        return self._fd
+
+    def _mapping(self):
+        """Return this process's mapping of the file, growing it if needed."""
+        fd = self._descriptor()
+        mapping = self._map
+        if mapping is None or len(mapping) < self._needed(mapping):
+            with self._locked():
+                size = os.fstat(fd).st_size
+                if size < self.HEADER.size:
+                    os.ftruncate(fd, self.HEADER.size)
+                    size = self.HEADER.size
+                # Old mappings stay valid: the file never shrinks.
+                mapping = self._map = mmap.mmap(fd, size)
+        return mapping
+
+    def _needed(self, mapping):
+        """Return the file size the header of a mapping calls for."""
+        if mapping is None:
+            return 0
+        return self.HEADER.size + (self._header(mapping)[2] + 7) // 8
+
+    def _header(self, mapping):
+        """Return the header fields; all zero before the first build."""
+        header = self.HEADER.unpack_from(mapping)
+        if header[0] != self.MAGIC:
+            return (self.MAGIC, 0, 0, 0, 0, 0, 0, 0, 0)
+        return header
+
+    def _write_header(self, mapping, *fields):
+        """Write the header fields after the magic."""
+        self.HEADER.pack_into(mapping, 0, self.MAGIC, *fields)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the writer lock, across threads and processes."""
+        fd = self._descriptor()
+        with self._lock:
+            # Re-entered when a locked write has to remap the file.
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def might_contain(self, email):
+        """
+        Tell whether an email may be registered.
+
+        Args:
+            email (str): The email address.
+
+        Returns:
+            bool: False only if the email is certainly not registered.
+        """
+        mapping = self._mapping()
+        _, generation, bits, hashes = self._header(mapping)[:4]
+        if bits == 0 or generation % 2:
+            return True
+        bloom = BloomFilter(mapping, bits, hashes, self.HEADER.size)
+        found = normalize_email(email) in bloom
+        # A rebuild that started meanwhile may have cleared bits we read.
+        return found or self._header(mapping)[1] != generation
+
+    def add(self, email):
+        """
+        Record a newly registered email.
+
+        Args:
+            email (str): The email address.
+        """
+        email = normalize_email(email)
+        with self._locked():
+            mapping = self._mapping()
+            header = list(self._header(mapping)[1:])
+            if header[1] == 0:
+                # Not built yet: the build reads the row from the table.
+                return
+            BloomFilter(mapping, header[1], header[2],
+                        self.HEADER.size).add(email)
+            header[4] += 1
+            self._write_header(mapping, *header)
+
+    def ensure_started(self):
+        """
+        Start the loader thread once per process.
+
+        Threads do not survive a fork, so this is called lazily from each
+        gunicorn worker rather than at import time.
+        """
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+            threading.Thread(target=self._run, name="email-filter",
+                             daemon=True).start()
+
+    def _run(self):
+        """Build the filter if needed, then keep adding new users."""
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error loading email filter: {str(e)}")
+            time.sleep(self.refresh_interval)
+
+    def _load(self, db, bloom, after_id):
+        """
+        Add the emails of users with an id above after_id.
+
+        Returns:
+            tuple: (count, max_id) of the users added.
+        """
+        count, max_id = 0, after_id
+        for user_id, email in db.fetch_iter(
+                "SELECT id, email FROM users WHERE id > %s ORDER BY id",
+                (after_id,), dictionary=False):
+            bloom.add(normalize_email(email))
+            count += 1
+            max_id = user_id
+        return count, max_id
+
+    def rebuild(self):
+        """
+        Load every registered email into a freshly sized filter.
+
+        Registrations wait for the lock until the rebuild completes, and
+        lookups meanwhile answer "possibly present".
+        """
+        db = Database(pool=get_pool())
+        try:
+            with self._locked():
+                self._rebuild(db)
+        finally:
+            db.close()
+
+    def _rebuild(self, db):
+        """Rebuild the filter; the caller holds the writer lock."""
+        mapping = self._mapping()
+        generation = self._header(mapping)[1] + 1
+        total = db.fetch_one("SELECT COUNT(*) FROM users",
+                             dictionary=False)[0]
+        # Leave headroom so growth does not force a rebuild soon.
+        capacity = max(self.capacity, total * 2)
+        bits, hashes = BloomFilter.size_for(capacity, self.error_rate)
+        self._write_header(mapping, generation, 0, 0, 0, 0, 0, 0, 0)
+        size = self.HEADER.size + (bits + 7) // 8
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+            mapping = self._map = mmap.mmap(self._fd, size)
+        mapping[self.HEADER.size:size] = bytes(size - self.HEADER.size)
+        bloom = BloomFilter(mapping, bits, hashes, self.HEADER.size)
+        count, max_id = self._load(db, bloom, 0)
+        self._write_header(mapping, generation + 1, bits, hashes, capacity,
+                           count, max_id, count, int(time.time()))
+
+    def _in_step(self, db, max_id, rows):
+        """Tell whether the table still holds the rows the filter loaded."""
+        return db.fetch_one("SELECT COUNT(*) FROM users WHERE id <= %s",
+                            (max_id,), dictionary=False)[0] == rows
+
+    def refresh(self):
+        """
+        Add users stored since the last load, or rebuild the filter when
+        it is missing, full, due or out of step with the table.
+        """
+        db = Database(pool=get_pool())
+        try:
+            with self._locked():
+                mapping = self._mapping()
+                header = list(self._header(mapping)[1:])
+                (_, bits, hashes, capacity, count, max_id, rows,
+                 built_at) = header
+                if (bits == 0 or count > capacity
+                        or time.time() - built_at >= self.rebuild_interval
+                        or not self._in_step(db, max_id, rows)):
+                    self._rebuild(db)
+                    return
+                bloom = BloomFilter(mapping, bits, hashes, self.HEADER.size)
+                added, header[5] = self._load(db, bloom, max_id)
+                header[4] += added
+                header[6] += added
+                self._write_header(mapping, *header)
+        finally:
+            db.close()
+
+
+_email_filter = None
+_email_filter_lock = threading.Lock()
+
+
+def get_email_filter():
+    """
+    Return the process-wide EmailFilter, creating it on first use.
+
+    Returns:
+        EmailFilter: The filter of registered emails.
+    """
+    global _email_filter
+
+    if _email_filter is None:
+        with _email_filter_lock:
+            if _email_filter is None:
+                _email_filter = EmailFilter()
+    return _email_filter
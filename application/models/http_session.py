@@ -0,0 +1,87 @@
+"""This module provides the shared HTTP session used to talk to the vendor."""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# Number of distinct hosts whose connection pools are kept alive.
+POOL_CONNECTIONS = int(os.getenv("VENDOR_POOL_CONNECTIONS", "4"))
+# Maximum number of keep-alive connections kept per host.
+POOL_MAXSIZE = int(os.getenv("VENDOR_POOL_MAXSIZE", "32"))
+# Seconds to wait for the TCP/TLS connection and for the response.
+CONNECT_TIMEOUT = float(os.getenv("VENDOR_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("VENDOR_READ_TIMEOUT", "30"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=POOL_CONNECTIONS,
+                   pool_maxsize=POOL_MAXSIZE):
+    """
+    Create a requests session backed by a keep-alive connection pool.
+
+    Parameters:
+    - pool_connections (int): Number of per-host pools to cache.
+    - pool_maxsize (int): Maximum number of connections kept per host.
+
+    Returns:
+    - requests.Session: A session that reuses TCP/TLS connections.
+    """
+    session = requests.Session()
+    # pool_block makes extra threads wait for a free connection instead of
+    # opening (and then discarding) connections beyond pool_maxsize.
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the process-wide vendor session, creating it on first use.
+
+    The session is shared by every ServiceVendor instance and by every
+    thread of the worker, so the TLS handshake to the vending API is paid
+    once per pooled connection instead of once per request.
+
+    Returns:
+    - requests.Session: The shared session.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def default_timeout():
+    """
+    Return the default (connect, read) timeout tuple for vendor requests.
+
+    Returns:
+    - tuple: The connect and read timeouts in seconds.
+    """
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def _reset_session_after_fork():
+    """Drop the inherited session so a forked worker opens its own sockets."""
+    global _session, _session_lock
+
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_session_after_fork)
@@ -0,0 +1,237 @@
+"""This module hashes and checks user passwords with bcrypt."""
+import argparse
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# bcrypt cost factor: each step doubles the time per hash. Pick it with
+# `python -m application.models.password_hasher --target-ms 250`.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashes computed at once; more only queue up behind the CPU cores.
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+
+
+class PasswordHasher:
+    """
+    Hash and verify passwords on a bounded pool of worker threads.
+
+    bcrypt releases the GIL while it works, so the pool hashes on as many
+    cores as it has workers, and a burst of logins waits in the pool's
+    queue instead of oversubscribing the CPU.
+
+    Passwords stored before hashing was introduced are plaintext. They are
+    still accepted, compared in constant time, and needs_rehash() reports
+    them so they can be replaced by a hash on the next login.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=BCRYPT_WORKERS):
+        """
+        Initialize the hasher. The worker pool starts on first use.
+
+        Args:
+            rounds (int): The bcrypt cost factor for new hashes.
+            workers (int): The number of hashes computed concurrently.
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        """Return this process's worker pool."""
+        # Threads do not survive a fork, so each gunicorn worker gets its own.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="bcrypt")
+                    self._pid = pid
+        return self._executor
+
+    def hash(self, password):
+        """
+        Hash a password.
+
+        Args:
+            password (str): The plaintext password.
+
+        Returns:
+            str: The bcrypt hash to store.
+        """
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        hashed = self._pool().submit(
+            bcrypt.hashpw, password.encode("utf-8"), salt).result()
+        return hashed.decode("ascii")
+
+    def hash_many(self, passwords):
+        """
+        Hash many passwords, spread over the worker pool.
+
+        Args:
+            passwords (list): The plaintext passwords.
+
+        Returns:
+            list: Their bcrypt hashes, in the same order.
+        """
+        pool = self._pool()
+        futures = [pool.submit(bcrypt.hashpw, password.encode("utf-8"),
+                               bcrypt.gensalt(rounds=self.rounds))
+                   for password in passwords]
+        return [future.result().decode("ascii") for future in futures]
+
+    def verify(self, password, stored):
+        """
+        Check a password against what is stored for the user.
+
+        Args:
+            password (str): The plaintext password given at login.
+            stored (str): The stored bcrypt hash, or a legacy plaintext
+                password.
+
+        Returns:
+            bool: True if the password matches.
+        """
+        if not stored:
+            return False
+        if not is_bcrypt_hash(stored):
+            return hmac.compare_digest(password.encode("utf-8"),
+                                       stored.encode("utf-8"))
+        try:
+            return self._pool().submit(
+                bcrypt.checkpw, password.encode("utf-8"),
+                stored.encode("ascii")).result()
+        except ValueError:
+            # A malformed hash never matches.
+            return False
+
+    def needs_rehash(self, stored):
+        """
+        Tell whether a stored password should be hashed again.
+
+        Args:
+            stored (str): The stored bcrypt hash or legacy plaintext.
+
+        Returns:
+            bool: True for plaintext, or a hash made with another cost.
+        """
+        if not is_bcrypt_hash(stored):
+            return True
+        return hash_rounds(stored) != self.rounds
+
+
+def is_bcrypt_hash(stored):
+    """
+    Tell whether a stored password is a bcrypt hash.
+
+    Args:
+        stored (str): The stored password.
+
+    Returns:
+        bool: True for a $2a$, $2b$ or $2y$ hash.
+    """
+    return (len(stored) == 60 and stored[:4] in ("$2a$", "$2b$", "$2y$")
+            and stored[6] == "$")
+
+
+def hash_rounds(stored):
+    """
+    Return the cost factor a bcrypt hash was made with.
+
+    Args:
+        stored (str): A bcrypt hash.
+
+    Returns:
+        int: The cost factor.
+    """
+    return int(stored[4:6])
+
+
+def calibrate(target_ms=250, min_rounds=10, max_rounds=16, samples=3):
+    """
+    Find the highest cost whose hash takes no longer than a target.
+
+    Args:
+        target_ms (float): The time one hash may take on this machine.
+        min_rounds (int): The lowest cost considered.
+        max_rounds (int): The highest cost considered.
+        samples (int): Hashes timed per cost; the fastest counts.
+
+    Returns:
+        tuple: (rounds, timings), where timings maps each cost tried to
+            its time in milliseconds.
+    """
+    timings = {}
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        salt = bcrypt.gensalt(rounds=rounds)
+        best = None
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.hashpw(b"calibration password", salt)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings[rounds] = best
+        if best > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """
+    Return the process-wide PasswordHasher, creating it on first use.
+
+    Returns:
+        PasswordHasher: The hasher using BCRYPT_ROUNDS and BCRYPT_WORKERS.
+    """
+    global _hasher
+
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def main():
+    """Benchmark bcrypt on this machine and suggest BCRYPT_ROUNDS."""
+    parser = argparse.ArgumentParser(
+        description="Calibrate the bcrypt cost to a target hash time.")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+
+    rounds, timings = calibrate(args.target_ms, args.min_rounds,
+                                args.max_rounds)
+    for cost, elapsed in timings.items():
+        print(f"rounds={cost:2}  {elapsed:8.1f} ms/hash")
+
+    # Throughput with the pool, as logins would see it.
+    hasher = PasswordHasher(rounds=rounds)
+    count = hasher.workers * 4
+    started = time.perf_counter()
+    hasher.hash_many(["password"] * count)
+    elapsed = time.perf_counter() - started
+    print(f"{count / elapsed:.1f} hashes/s with {hasher.workers} workers "
+          f"at rounds={rounds}")
+    print(f"Suggested setting: BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == '__main__':
+    main()
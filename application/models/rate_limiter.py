@@ -0,0 +1,262 @@
+"""This module throttles login attempts with token buckets."""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from .email_filter import normalize_email
+
+# Load environment variables from .env
+load_dotenv()
+
+# Login attempts allowed per minute, and in a burst, per email address.
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "5"))
+LOGIN_EMAIL_BURST = float(os.getenv("LOGIN_EMAIL_BURST", "5"))
+# The same per client IP, looser since users may share an address.
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "30"))
+# Buckets kept in memory; the least recently used are dropped beyond this.
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+# If set, buckets live in this SQLite file, shared by all workers.
+LOGIN_THROTTLE_DB = os.getenv("LOGIN_THROTTLE_DB")
+
+
+def _refill(tokens, updated, now, rate, burst):
+    """Return the tokens in a bucket after refilling it up to now."""
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in this process, bounded in number.
+
+    When more than `max_keys` buckets exist the least recently used is
+    dropped; a dropped key simply starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys=LOGIN_THROTTLE_MAX_KEYS):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_keys (int): The maximum number of buckets kept.
+        """
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        """
+        Take tokens from a bucket if it holds enough.
+
+        Args:
+            key (str): The bucket to take from.
+            rate (float): Tokens added per second.
+            burst (float): The bucket's capacity.
+            cost (float): The tokens this attempt needs.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until
+                the bucket holds enough.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = _refill(tokens, updated, now, rate, burst)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        """Return the number of buckets kept."""
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite file, shared by every gunicorn worker.
+
+    Each take is one short write transaction. Buckets that have been full
+    for a while are pruned now and then, which keeps the table bounded by
+    the number of recently active keys.
+    """
+
+    def __init__(self, path, prune_every=1000):
+        """
+        Initialize the store, creating its table if needed.
+
+        Args:
+            path (str): The SQLite database file.
+            prune_every (int): Takes between prunes of idle buckets.
+        """
+        self.path = path
+        self.prune_every = prune_every
+        self._takes = 0
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS login_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, full_at REAL NOT NULL)")
+
+    def _connect(self):
+        """Return this thread's connection to the store."""
+        # Connections are per thread, and never reused across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, burst, cost=1.0):
+        """
+        Take tokens from a bucket if it holds enough.
+
+        Args:
+            key (str): The bucket to take from.
+            rate (float): Tokens added per second.
+            burst (float): The bucket's capacity.
+            cost (float): The tokens this attempt needs.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until
+                the bucket holds enough.
+        """
+        # Wall clock time, since the buckets are shared between processes.
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM login_buckets WHERE key = ?",
+                (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = _refill(tokens, updated, now, rate, burst)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO login_buckets "
+                "(key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (burst - tokens) / rate))
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                conn.execute("DELETE FROM login_buckets WHERE full_at < ?",
+                             (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class TokenBucketLimiter:
+    """
+    Allow `burst` attempts at once per key, refilled at `per_minute`.
+    """
+
+    def __init__(self, per_minute, burst, store):
+        """
+        Initialize the limiter.
+
+        Args:
+            per_minute (float): Attempts regained per minute.
+            burst (float): Attempts allowed back to back.
+            store (MemoryBucketStore or SQLiteBucketStore): Where the
+                buckets are kept.
+        """
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.store = store
+
+    def hit(self, key):
+        """
+        Count an attempt for a key.
+
+        Args:
+            key (str): What the attempt is charged to.
+
+        Returns:
+            float: 0 if the attempt is allowed, otherwise the seconds to
+                wait before retrying.
+        """
+        return self.store.take(key, self.rate, self.burst)
+
+
+class LoginThrottle:
+    """
+    Limit login attempts per client IP and per email address.
+
+    The IP limit stops one client spraying many accounts; the email limit
+    stops many clients guessing one account's password. Emails are keyed
+    the way the users table compares them, so spelling an address with
+    other case or accents still counts against the same account.
+    """
+
+    def __init__(self, store=None):
+        """
+        Initialize the throttle.
+
+        Args:
+            store (MemoryBucketStore or SQLiteBucketStore): Where buckets
+                are kept. Defaults to memory.
+        """
+        store = store if store is not None else MemoryBucketStore()
+        self.by_ip = TokenBucketLimiter(
+            LOGIN_IP_PER_MINUTE, LOGIN_IP_BURST, store)
+        self.by_email = TokenBucketLimiter(
+            LOGIN_EMAIL_PER_MINUTE, LOGIN_EMAIL_BURST, store)
+
+    def check(self, email, ip):
+        """
+        Count a login attempt and tell whether it may proceed.
+
+        Args:
+            email (str): The email address being logged into.
+            ip (str): The client's IP address.
+
+        Returns:
+            float: 0 if the attempt may proceed, otherwise the seconds to
+                wait before retrying.
+        """
+        wait = self.by_ip.hit(f"ip:{ip}")
+        if wait:
+            # Rejected attempts do not use up the account's budget.
+            return wait
+        return self.by_email.hit(f"email:{normalize_email(email)}")
+
+
+_login_throttle = None
+_login_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """
+    Return the process-wide LoginThrottle, creating it on first use.
+
+    Returns:
+        LoginThrottle: Backed by LOGIN_THROTTLE_DB when it is set,
+            otherwise by memory.
+    """
+    global _login_throttle
+
+    if _login_throttle is None:
+        with _login_throttle_lock:
+            if _login_throttle is None:
+                store = (SQLiteBucketStore(LOGIN_THROTTLE_DB)
+                         if LOGIN_THROTTLE_DB else None)
+                _login_throttle = LoginThrottle(store)
+    return _login_throttle
@@ -1,33 +1,74 @@
+from contextlib import contextmanager
+from flask import has_app_context
+from db_pool import get_db, close_db, get_pool
 from db_handler import Database
-import bcrypt
-import base64
+from db_handler import DuplicateEntryError
+from application.models.password_hasher import get_hasher
+from application.models.email_filter import get_email_filter
+from application.models.email_filter import normalize_email
 
 
 class RegistrationManager:
     """
     A class for managing user registration.
 
+    One instance serves the whole process. It keeps no per-request state:
+    each call borrows a pooled connection, so concurrent requests can share
+    it safely.
+
     Attributes:
         app (Flask app): The Flask application instance.
-        db (Database): An instance of the Database class for database
-                        interactions.
+        db (Database): The Database checked out for the current request.
     """
 
     def __init__(self, app):
         """
-        Initialize the RegistrationManager with Flask app and a database
-        connection.
+        Initialize the RegistrationManager with Flask app.
+
+        No connection is opened here; a pooled connection is borrowed when
+        a query runs.
 
         Args:
             app (Flask app): The Flask application instance.
         """
         self.app = app
-        self.db = Database()
+
+    @property
+    def db(self):
+        """
+        The Database checked out for the current request.
+        """
+        return get_db()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled connection for one call.
+
+        Inside a request this is the request's connection, returned to the
+        pool at teardown. Outside one (scripts, background threads) a
+        connection is checked out for the block only.
+
+        Yields:
+            Database: The database handle to use.
+        """
+        if has_app_context():
+            yield get_db()
+            return
+        db = Database(pool=get_pool())
+        try:
+            yield db
+        finally:
+            db.close()
 
     def register_user(self, first_name, last_name, email, phone, password):
         """
         Register a new user and store their information in the database.
 
+        This is a single INSERT: the UNIQUE index on users.email (see
+        migrations/) rejects an email that is already registered, which
+        also holds when two signups for the same email race.
+
         Args:
             firstname (str): User's first name.
             lastname (str): User's last name.
@@ -38,13 +79,6 @@ class RegistrationManager:
         Returns:
             str: A registration success message or an error message.
         """
-        # Check if the user already exists
-        existing_user = self.db.fetch_one(
-            "SELECT * FROM users WHERE email = %s", (email,))
-
-        if existing_user:
-            return "Email already in use."
-
         # Create a new user with the hashed password
         query = ("INSERT INTO users ("
                  "first_name, "
@@ -54,15 +88,79 @@ class RegistrationManager:
                  "password) "
                  "VALUES (%s, %s, %s, %s, %s)")
 
-        params = (first_name, last_name, email, phone, password)
+        params = (first_name, last_name, email, phone,
+                  get_hasher().hash(password))
 
-        success = self.db.execute_query(query, params)
+        try:
+            with self.connection() as db:
+                user_id = db.insert(query, params)
+        except DuplicateEntryError:
+            # Known to exist, even if registered by another process.
+            get_email_filter().add(email)
+            return "Email already in use."
 
-        if success:
+        if user_id is not None:
+            get_email_filter().add(email)
             return "Registration successful!"
         else:
             return "Registration failed. Please try again later."
 
+    def register_users(self, users):
+        """
+        Register a batch of users with one lookup and one multi-row INSERT.
+
+        Emails already registered are skipped before any password is
+        hashed. Passwords are hashed in parallel on the hasher's pool. If a
+        concurrent signup takes one of the emails in the meantime, the batch
+        falls back to inserting row by row.
+
+        Args:
+            users (list): (first_name, last_name, email, phone, password)
+                tuples with plaintext passwords and distinct emails.
+
+        Returns:
+            tuple: (registered, duplicates) - the emails of the users added,
+                and the emails skipped because they were already
+                registered. Any other email in the batch failed to insert.
+        """
+        users = list(users)
+        query = ("INSERT INTO users ("
+                 "first_name, "
+                 "last_name, "
+                 "email, "
+                 "phone, "
+                 "password) "
+                 "VALUES (%s, %s, %s, %s, %s)")
+
+        with self.connection() as db:
+            existing = {normalize_email(email) for email in
+                        db.find_existing_emails([user[2] for user in users])}
+            fresh = [user for user in users
+                     if normalize_email(user[2]) not in existing]
+            duplicates = [user[2] for user in users
+                          if normalize_email(user[2]) in existing]
+
+            hashes = get_hasher().hash_many([user[4] for user in fresh])
+            rows = [user[:4] + (hashed,)
+                    for user, hashed in zip(fresh, hashes)]
+
+            registered = []
+            try:
+                db.execute_many(query, rows, chunk_size=len(rows) or 1)
+                registered = rows
+            except DuplicateEntryError:
+                for row in rows:
+                    try:
+                        if db.insert(query, row) is not None:
+                            registered.append(row)
+                    except DuplicateEntryError:
+                        duplicates.append(row[2])
+
+        email_filter = get_email_filter()
+        for row in registered:
+            email_filter.add(row[2])
+        return [row[2] for row in registered], duplicates
+
     def login_user(self, email, password):
         """
         Authenticate a user's login and return a success message or an error
@@ -75,13 +173,24 @@ class RegistrationManager:
         Returns:
             str: A login success message or an error message.
         """
-        # Retrieve the user's information from the database
-        query = "SELECT * FROM users WHERE email = %s"
-        print(f"Executing query: {query} with email = {email}")
-        user_data = self.db.fetch_one(query, (email,))
+        # Unknown emails are answered without a query
+        if not get_email_filter().might_contain(email):
+            return "Email not found."
 
-        if user_data is not None:
-            if user_data.get('password', '') == password:
+        # Retrieve only the user's id and password from the database
+        with self.connection() as db:
+            credentials = db.find_credentials_by_email(email)
+
+        if credentials is not None:
+            user_id, stored_password = credentials
+            hasher = get_hasher()
+            if hasher.verify(password, stored_password):
+                # Upgrade plaintext or outdated-cost hashes while we have
+                # the password.
+                if hasher.needs_rehash(stored_password):
+                    new_hash = hasher.hash(password)
+                    with self.connection() as db:
+                        db.update_user_password(user_id, new_hash)
                 return "Login successful!"
             else:
                 return "Incorrect password."
@@ -90,6 +199,10 @@ class RegistrationManager:
 
     def close_database_connection(self):
         """
-        Close the database connection when it's no longer needed.
+        Release the request's database connection back to the pool.
+
+        Calling this is optional: the connection is also returned when the
+        request's app context is torn down.
         """
-        self.db.close()
+        if has_app_context():
+            close_db()
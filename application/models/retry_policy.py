@@ -0,0 +1,146 @@
+"""This module decides when and how long to wait before retrying a call."""
+import os
+import random
+import threading
+import uuid
+
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+MAX_ATTEMPTS = int(os.getenv("VEND_RETRY_ATTEMPTS", "4"))
+BASE_DELAY = float(os.getenv("VEND_RETRY_BASE_DELAY", "0.5"))
+MAX_DELAY = float(os.getenv("VEND_RETRY_MAX_DELAY", "8"))
+# Retries allowed per request, averaged over time (0.2 = one in five).
+BUDGET_RATIO = float(os.getenv("VEND_RETRY_BUDGET_RATIO", "0.2"))
+
+# HTTP statuses worth retrying: the vendor did not process the request.
+RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+
+def idempotency_key(trx_id, operation="vend-execute"):
+    """
+    Derive a stable idempotency key for an operation on a transaction.
+
+    The same trx_id always yields the same key, so every retry of one
+    vend, even from another worker, is recognisable by the vendor.
+
+    Parameters:
+    - trx_id (str): The transaction ID from the vend validation response.
+    - operation (str): The operation the key is used for.
+
+    Returns:
+    - str: The idempotency key.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{operation}:{trx_id}"))
+
+
+class RetryBudget:
+    """
+    Limit retries to a fraction of the requests sent.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so
+    when the vendor is down retries cannot multiply the load on it.
+    """
+
+    def __init__(self, ratio=BUDGET_RATIO, min_tokens=10, max_tokens=100):
+        """
+        Initialize the budget.
+
+        Parameters:
+        - ratio (float): Tokens earned per request.
+        - min_tokens (float): Tokens available on start.
+        - max_tokens (float): Maximum number of tokens saved up.
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Credit the budget for a request sent."""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        Try to spend one retry.
+
+        Returns:
+        - bool: True if the retry is allowed.
+        """
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by a retry budget.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, budget=None):
+        """
+        Initialize the policy.
+
+        Parameters:
+        - max_attempts (int): Maximum number of attempts, first included.
+        - base_delay (float): Backoff delay in seconds before the 1st retry.
+        - max_delay (float): Upper bound in seconds for a single delay.
+        - budget (RetryBudget): The budget retries are paid from.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def delay(self, attempt):
+        """
+        Return the delay before the next attempt.
+
+        Parameters:
+        - attempt (int): The number of the attempt that just failed.
+
+        Returns:
+        - float: The delay in seconds.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def is_retryable(self, response=None, error=None):
+        """
+        Tell whether a failed attempt is worth retrying.
+
+        Parameters:
+        - response (requests.Response): The response, if one was received.
+        - error (Exception): The exception raised, if any.
+
+        Returns:
+        - bool: True for connection errors, timeouts and transient statuses.
+        """
+        if error is not None:
+            return isinstance(
+                error, (requests.ConnectionError, requests.Timeout))
+        return response is not None and (
+            response.status_code in RETRYABLE_STATUSES)
+
+    def should_retry(self, attempt, response=None, error=None):
+        """
+        Decide whether to make another attempt.
+
+        Parameters:
+        - attempt (int): The number of the attempt that just failed.
+        - response (requests.Response): The response, if one was received.
+        - error (Exception): The exception raised, if any.
+
+        Returns:
+        - bool: True if the caller should retry after delay(attempt).
+        """
+        return (attempt < self.max_attempts
+                and self.is_retryable(response, error)
+                and self.budget.withdraw())
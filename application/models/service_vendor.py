@@ -1,6 +1,19 @@
-import requests
+import copy
 import json
-from .access_token import get_token  # Import the get_token function
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .token_manager import get_token_manager
+from .http_session import get_session, default_timeout
+from .circuit_breaker import get_breaker, guarded_request
+from .retry_policy import RetryPolicy, idempotency_key
+from .vend_attempts import get_attempt_log
+
+# The outcome of one validation in a batch. Exactly one of response and
+# error is set.
+ValidationResult = namedtuple(
+    "ValidationResult",
+    ["vertical_id", "customer_account_number", "response", "error"])
 
 
 class ServiceVendor:
@@ -8,7 +21,9 @@ class ServiceVendor:
     A class for vending airtime using the provided API.
     """
 
-    def __init__(self, base_url, api_key, api_secret):
+    def __init__(self, base_url, api_key, api_secret, session=None,
+                 timeout=None, token_manager=None, validate_cache=None,
+                 retry_policy=None, attempt_log=None):
         """
         Initialize the Airtime instance.
 
@@ -16,74 +31,285 @@ class ServiceVendor:
         - base_url (str): The base URL of the vending API.
         - api_key (str): The API key used for authentication.
         - api_secret (str): The API secret used for authentication.
+        - session (requests.Session): The HTTP session to send requests on.
+                Defaults to the process-wide pooled session.
+        - timeout (tuple): The (connect, read) timeout in seconds.
+                Defaults to the VENDOR_CONNECT_TIMEOUT and
+                VENDOR_READ_TIMEOUT settings.
+        - token_manager (TokenManager): The cache the access token is taken
+                from. Defaults to the process-wide token manager.
+        - validate_cache (TTLCache): Optional cache of successful
+                validations keyed by (vertical_id, customer_account_number).
+                Caching is disabled when None.
+        - retry_policy (RetryPolicy): How failed executions are retried.
+        - attempt_log (VendAttemptLog): The ledger of execution attempts.
+                Defaults to the process-wide ledger at VEND_ATTEMPTS_DB.
         """
         self.base_url = base_url
         self.api_key = api_key
         self.api_secret = api_secret
+        self.session = session if session is not None else get_session()
+        self.timeout = timeout if timeout is not None else default_timeout()
+        self.token_manager = (token_manager if token_manager is not None
+                              else get_token_manager())
+        self.validate_cache = validate_cache
+        self.retry_policy = (retry_policy if retry_policy is not None
+                             else RetryPolicy())
+        self.attempt_log = attempt_log
         self.access_token = self.generate_access_token()
 
     def generate_access_token(self):
         """
-        Generate an access token using the provided API key and API secret.
+        Return a valid access token from the shared token cache.
+
+        A new token is only requested from the API when the cached one is
+        missing or about to expire.
 
         Returns:
         - str: The obtained access token.
         """
-        return get_token()  # Return token as a value.
+        return self.token_manager.get_token()
 
-    def perform_authenticated_request(self, url, method="GET", data=None):
+    def perform_authenticated_request(self, url, method="GET", data=None,
+                                      timeout=None, endpoint=None):
         """
         Perform an authenticated request to the API.
 
+        Requests go through the circuit breaker of their endpoint, which
+        fails fast with CircuitOpenError while the vendor is unhealthy.
+
         Parameters:
         - url (str): The URL for the request.
         - method (str): The HTTP method (GET or POST).
         - data (dict): The request payload for POST requests.
+        - timeout (tuple): The (connect, read) timeout for this request.
+                Defaults to the instance timeout.
+        - endpoint (str): The circuit breaker name. Defaults to the last
+                segment of the URL.
 
         Returns:
         - dict: The JSON response from the API.
         """
-        headers = {
+        return self.send_authenticated_request(
+            url, method=method, data=data, timeout=timeout,
+            endpoint=endpoint).json()
+
+    def send_authenticated_request(self, url, method="GET", data=None,
+                                   timeout=None, endpoint=None,
+                                   headers=None):
+        """
+        Send an authenticated request and return the raw response.
+
+        The token is refreshed and the request re-sent once on a 401.
+
+        Parameters:
+        - url (str): The URL for the request.
+        - method (str): The HTTP method (GET or POST).
+        - data (dict): The request payload for POST requests.
+        - timeout (tuple): The (connect, read) timeout for this request.
+        - endpoint (str): The circuit breaker name.
+        - headers (dict): Extra headers to send.
+
+        Returns:
+        - requests.Response: The response from the API.
+        """
+        if method not in ("GET", "POST"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        if timeout is None:
+            timeout = self.timeout
+        breaker = get_breaker(endpoint or url.rstrip("/").rsplit("/", 1)[-1])
+        # Fail fast before spending a token refresh on an open circuit.
+        breaker.check()
+
+        # Keep the token in a local so concurrent threads sharing this
+        # instance never invalidate each other's tokens.
+        access_token = self.generate_access_token()
+        request_headers = {
             "Accept": "application/json",
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
         }
+        request_headers.update(headers or {})
 
-        if method == "GET":
-            response = requests.get(url, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, headers=headers, json=data)
-        else:
-            raise ValueError(f"Unsupported HTTP method: {method}")
+        response = guarded_request(
+            breaker, self.session, method, url, timeout,
+            headers=request_headers, json=data)
 
         if response.status_code == 401:
-            self.access_token = self.generate_access_token()
-            headers["Authorization"] = f"Bearer {self.access_token}"
-            response = requests.get(
-                url, headers=headers) if method == "GET" else requests.post(
-                url, headers=headers, json=data)
+            # Drop the rejected token; concurrent 401s share one refresh.
+            self.token_manager.invalidate(access_token)
+            access_token = self.generate_access_token()
+            request_headers["Authorization"] = f"Bearer {access_token}"
+            response = guarded_request(
+                breaker, self.session, method, url, timeout,
+                headers=request_headers, json=data)
 
-        return response.json()
+        self.access_token = access_token
+        return response
 
-    def vend_validate(self, vertical_id, customer_account_number):
+    def vend_validate(self, vertical_id, customer_account_number,
+                      timeout=None, use_cache=True):
         """
         Perform vend validation.
 
+        When the instance has a validate_cache, a successful validation of
+        the same account within the cache TTL is answered from the cache.
+        A cached response carries the trxId of the earlier validation, so
+        anything that will pay for and execute a vend must pass
+        use_cache=False to get a transaction id of its own; such calls
+        neither read nor fill the cache.
+
         Parameters:
         - vertical_id (str): The service/product vertical unique identifier.
         - customer_account_number (str): The account number for the customer.
+        - timeout (tuple): The (connect, read) timeout for this call.
+        - use_cache (bool): Set to False to always ask the vendor and
+                leave the cache alone, as every purchase must.
 
         Returns:
         - dict: The JSON response from the vend validation.
         """
+        cache_key = (vertical_id, customer_account_number)
+        if use_cache and self.validate_cache is not None:
+            cached = self.validate_cache.get(cache_key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
         url = f"{self.base_url}/vend/validate"
         data = {
             "verticalId": vertical_id,
             "customerAccountNumber": customer_account_number,
         }
 
-        return self.perform_authenticated_request(
-            url, method="POST", data=data)
+        response = self.perform_authenticated_request(
+            url, method="POST", data=data, timeout=timeout,
+            endpoint="validate")
+
+        # Only cache validations that produced a transaction id, so errors
+        # are retried on the next submit.
+        if (use_cache and self.validate_cache is not None
+                and isinstance(response, dict)
+                and response.get("data", {}).get("trxId")):
+            self.validate_cache.set(cache_key, copy.deepcopy(response))
+
+        return response
+
+    def forget_validation(self, vertical_id, customer_account_number):
+        """
+        Drop the cached validation of an account.
+
+        Called once its trxId is executed or queued, so the transaction id
+        is never handed out again.
+
+        Parameters:
+        - vertical_id (str): The service/product vertical unique identifier.
+        - customer_account_number (str): The account number for the customer.
+        """
+        if self.validate_cache is not None:
+            self.validate_cache.pop((vertical_id, customer_account_number))
+
+    def vend_validate_many(self, accounts, max_concurrency=8, timeout=None):
+        """
+        Validate many accounts concurrently, yielding results as they finish.
+
+        At most max_concurrency validations are in flight, and the input is
+        consumed lazily, so arbitrarily long batches use bounded memory.
+        A failing item is reported in its own result and does not stop the
+        rest of the batch. The validate cache is bypassed, so every result
+        carries a trxId of its own.
+
+        An item still running after timeout seconds is reported with a
+        TimeoutError. Its thread cannot be stopped and keeps its slot until
+        the request ends, which the same timeout on each read bounds.
+
+        Parameters:
+        - accounts (iterable): (vertical_id, customer_account_number) pairs.
+        - max_concurrency (int): Maximum number of in-flight validations.
+        - timeout (float): Overall time limit in seconds for each item.
+
+        Yields:
+        - ValidationResult: One result per input pair, in completion order.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        request_timeout = None
+        if timeout is not None:
+            request_timeout = (min(self.timeout[0], timeout), timeout)
+
+        pairs = iter(accounts)
+        # Read one pair ahead, to know when the input is exhausted.
+        upcoming = next(pairs, None)
+        # future -> (vertical_id, customer_account_number, deadline)
+        pending = {}
+        # Timed-out validations whose threads are still running.
+        abandoned = set()
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        def submit_next():
+            nonlocal upcoming
+            if upcoming is None:
+                return False
+            vertical_id, customer_account_number = upcoming
+            upcoming = next(pairs, None)
+            future = executor.submit(
+                self._validate_one, vertical_id,
+                customer_account_number, request_timeout)
+            deadline = (None if timeout is None
+                        else time.monotonic() + timeout)
+            pending[future] = (vertical_id, customer_account_number, deadline)
+            return True
+
+        def fill():
+            # Only submit work that starts at once, so deadlines are fair.
+            abandoned.difference_update(
+                [future for future in abandoned if future.done()])
+            while (len(pending) + len(abandoned) < max_concurrency
+                   and submit_next()):
+                pass
+
+        try:
+            fill()
+            # With every slot held by a timed-out thread, pending is empty
+            # until one of them ends and fill() submits more.
+            while pending or upcoming is not None:
+                wait_timeout = None
+                if timeout is not None and pending:
+                    wait_timeout = max(0, min(
+                        deadline for _, _, deadline in pending.values())
+                        - time.monotonic())
+                wait(set(pending) | abandoned, timeout=wait_timeout,
+                     return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                results = []
+                for future, item in list(pending.items()):
+                    vertical_id, customer_account_number, deadline = item
+                    if future.done():
+                        del pending[future]
+                        results.append(future.result())
+                    elif deadline is not None and now >= deadline:
+                        del pending[future]
+                        abandoned.add(future)
+                        results.append(ValidationResult(
+                            vertical_id, customer_account_number, None,
+                            TimeoutError("Validation took longer than "
+                                         f"{timeout} seconds.")))
+                fill()
+                yield from results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _validate_one(self, vertical_id, customer_account_number, timeout):
+        """Validate one account of a batch, capturing any error."""
+        try:
+            response = self.vend_validate(
+                vertical_id, customer_account_number, timeout=timeout,
+                use_cache=False)
+            return ValidationResult(
+                vertical_id, customer_account_number, response, None)
+        except Exception as e:
+            return ValidationResult(
+                vertical_id, customer_account_number, None, e)
 
     def vend_execute(
             self,
@@ -97,6 +323,12 @@ class ServiceVendor:
         """
         Perform vend execution.
 
+        Connection errors, timeouts and transient 5xx/429 responses are
+        retried with exponential backoff, within the retry budget. Every
+        attempt carries the same Idempotency-Key, derived from trx_id, and
+        is recorded in the attempt log; a trx_id the vendor has already
+        accepted returns the stored response without vending again.
+
         Parameters:
         - trx_id (str): The transaction ID from the vend validation response.
         - customer_account_number (str): The account number for the customer.
@@ -120,8 +352,40 @@ class ServiceVendor:
             "callBack": callback,
         }
 
-        return self.perform_authenticated_request(
-            url, method="POST", data=data)
+        self.forget_validation(vertical_id, customer_account_number)
+
+        attempt_log = (self.attempt_log if self.attempt_log is not None
+                       else get_attempt_log())
+        previous = attempt_log.get_result(trx_id)
+        if previous is not None:
+            return previous
+
+        key = idempotency_key(trx_id)
+        policy = self.retry_policy
+        policy.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_id = attempt_log.start_attempt(trx_id, attempt, key)
+            try:
+                response = self.send_authenticated_request(
+                    url, method="POST", data=data, endpoint="execute",
+                    headers={"Idempotency-Key": key})
+            except Exception as e:
+                attempt_log.finish_attempt(attempt_id, error=str(e))
+                if not policy.should_retry(attempt, error=e):
+                    raise
+            else:
+                attempt_log.finish_attempt(
+                    attempt_id, status_code=response.status_code)
+                if not policy.should_retry(attempt, response=response):
+                    break
+            time.sleep(policy.delay(attempt))
+
+        execute_response = response.json()
+        if response.ok:
+            attempt_log.record_result(trx_id, execute_response)
+        return execute_response
 
 
 if __name__ == "__main__":
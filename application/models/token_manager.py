@@ -0,0 +1,281 @@
+"""This module caches the vendor access token between transactions."""
+import fcntl
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .access_token import fetch_token
+
+# Load environment variables from .env
+load_dotenv()
+
+# Lifetime assumed for a token when the vendor does not report one.
+DEFAULT_TOKEN_TTL = float(os.getenv("VENDOR_TOKEN_TTL", "600"))
+# Seconds before expiry at which the token is refreshed.
+REFRESH_MARGIN = float(os.getenv("VENDOR_TOKEN_REFRESH_MARGIN", "60"))
+# Longest pause in seconds between background retries while /auth fails.
+REFRESH_MAX_BACKOFF = float(os.getenv("VENDOR_TOKEN_MAX_BACKOFF", "60"))
+# Optional file shared by all workers of a host to hold the token.
+TOKEN_CACHE_FILE = os.getenv("VENDOR_TOKEN_CACHE_FILE")
+
+
+class FileTokenStore:
+    """
+    A token store backed by a local JSON file.
+
+    Every gunicorn worker on the host reads the same file, and refreshes
+    are serialized with an exclusive lock on a sibling lock file, so only
+    one worker calls /auth when the token is about to lapse.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the store.
+
+        Parameters:
+        - path (str): The path of the JSON file holding the token.
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def load(self):
+        """
+        Read the stored token.
+
+        Returns:
+        - tuple: (token, expires_at), or (None, 0) if nothing is stored.
+        """
+        try:
+            with open(self.path) as token_file:
+                data = json.load(token_file)
+            return data.get("token"), float(data.get("expires_at", 0))
+        except (OSError, ValueError):
+            return None, 0
+
+    def save(self, token, expires_at):
+        """
+        Atomically replace the stored token.
+
+        Parameters:
+        - token (str): The access token.
+        - expires_at (float): The epoch time at which the token expires.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as token_file:
+            json.dump({"token": token, "expires_at": expires_at}, token_file)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def locked(self):
+        """
+        Return a context manager holding the cross-process refresh lock.
+
+        Returns:
+        - _FileLock: The lock context manager.
+        """
+        return _FileLock(self.lock_path)
+
+
+class _FileLock:
+    """An exclusive advisory lock on a file, held inside a with-block."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+class TokenManager:
+    """
+    A thread-safe cache for the vendor bearer token.
+
+    The token is kept until shortly before it expires. Concurrent refreshes
+    are collapsed into a single /auth call, and a background thread renews
+    the token ahead of expiry so the vend path never waits for /auth.
+    """
+
+    def __init__(self, fetch=fetch_token, store=None,
+                 default_ttl=DEFAULT_TOKEN_TTL,
+                 refresh_margin=REFRESH_MARGIN):
+        """
+        Initialize the TokenManager.
+
+        Parameters:
+        - fetch (callable): Returns a (token, expires_in) tuple.
+        - store (FileTokenStore): Optional store shared between workers.
+        - default_ttl (float): Lifetime used when the vendor reports none.
+        - refresh_margin (float): Seconds before expiry to refresh.
+        """
+        self.fetch = fetch
+        self.store = store
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = 0
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+        self._wakeup = threading.Event()
+
+    def _is_fresh(self, expires_at, now=None):
+        """Tell whether a token expiring at expires_at can still be used."""
+        now = time.time() if now is None else now
+        return expires_at - self.refresh_margin > now
+
+    def get_token(self):
+        """
+        Return a valid access token, refreshing it only when needed.
+
+        Returns:
+        - str: The access token, or None if /auth failed.
+        """
+        self._ensure_refresher()
+        token = self.cached_token()
+        if token:
+            return token
+        return self.refresh(stale_token=self.token)
+
+    def cached_token(self):
+        """
+        Return the cached token if it is still fresh, without blocking.
+
+        Returns:
+        - str: The cached access token, or None if it must be refreshed.
+        """
+        token, expires_at = self.token, self.expires_at
+        if token and self._is_fresh(expires_at):
+            return token
+        return None
+
+    def invalidate(self, token):
+        """
+        Mark a token rejected by the vendor (HTTP 401) as expired.
+
+        Only the given token is dropped; if another thread has already
+        replaced it, the newer token is kept.
+
+        Parameters:
+        - token (str): The token that was rejected.
+        """
+        with self._lock:
+            if self.token == token:
+                self.expires_at = 0
+
+    def refresh(self, stale_token=None):
+        """
+        Obtain a new token, unless another caller already did.
+
+        Threads that arrive while a refresh is in flight wait for it and
+        reuse its result instead of calling /auth themselves.
+
+        Parameters:
+        - stale_token (str): The token the caller found unusable.
+
+        Returns:
+        - str: The access token, or None if /auth failed.
+        """
+        with self._lock:
+            if (self.token and self.token != stale_token
+                    and self._is_fresh(self.expires_at)):
+                return self.token
+            if self.store is None:
+                renewed = self._fetch()
+            else:
+                with self.store.locked():
+                    token, expires_at = self.store.load()
+                    renewed = bool(token and token != stale_token
+                                   and self._is_fresh(expires_at))
+                    if renewed:
+                        self.token, self.expires_at = token, expires_at
+                    else:
+                        renewed = self._fetch()
+                        if renewed:
+                            self.store.save(self.token, self.expires_at)
+            if renewed:
+                # Only a new token reschedules the background refresher;
+                # waking it after a failure would make it spin on /auth.
+                self._wakeup.set()
+            return self.token
+
+    def _fetch(self):
+        """Call /auth and remember the result. Must hold self._lock."""
+        token, expires_in = self.fetch()
+        if not token:
+            return False
+        ttl = expires_in if expires_in else self.default_ttl
+        self.token = token
+        self.expires_at = time.time() + ttl
+        return True
+
+    def _ensure_refresher(self):
+        """Start the background refresh thread once per process."""
+        pid = os.getpid()
+        if self._refresher_pid == pid:
+            return
+        with self._lock:
+            if self._refresher_pid == pid:
+                return
+            self._refresher_pid = pid
+            thread = threading.Thread(
+                target=self._refresh_loop,
+                name="vendor-token-refresher",
+                daemon=True)
+            thread.start()
+
+    def _refresh_loop(self):
+        """Renew the token shortly before it expires, forever."""
+        failures = 0
+        while True:
+            delay = self.expires_at - self.refresh_margin - time.time()
+            if self.token and delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            try:
+                self.refresh(stale_token=self.token)
+            except Exception as e:
+                print(f"Background token refresh failed: {str(e)}")
+            if self.token and self._is_fresh(self.expires_at):
+                failures = 0
+            else:
+                # /auth is failing; back off exponentially. Sleeping rather
+                # than waiting on _wakeup keeps a failed refresh elsewhere
+                # from cutting the pause short.
+                failures += 1
+                time.sleep(min(REFRESH_MAX_BACKOFF, 2 ** (failures - 1)))
+
+
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+
+def get_token_manager():
+    """
+    Return the process-wide TokenManager, creating it on first use.
+
+    When VENDOR_TOKEN_CACHE_FILE is set, the token is shared through that
+    file by every worker on the host.
+
+    Returns:
+    - TokenManager: The shared token manager.
+    """
+    global _token_manager
+
+    if _token_manager is None:
+        with _token_manager_lock:
+            if _token_manager is None:
+                store = (FileTokenStore(TOKEN_CACHE_FILE)
+                         if TOKEN_CACHE_FILE else None)
+                _token_manager = TokenManager(store=store)
+    return _token_manager
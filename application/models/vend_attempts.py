@@ -0,0 +1,165 @@
+"""This module keeps a local record of vend execution attempts."""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+VEND_ATTEMPTS_DB = os.getenv("VEND_ATTEMPTS_DB", "vend_attempts.db")
+
+
+class VendAttemptLog:
+    """
+    A SQLite ledger of vend execution attempts and their outcomes.
+
+    Every attempt is recorded before it is sent. Once the vendor accepts an
+    execution its response is stored, and later executions of the same
+    trx_id return that response instead of vending a second time.
+    """
+
+    def __init__(self, path=VEND_ATTEMPTS_DB):
+        """
+        Initialize the ledger, creating its tables if needed.
+
+        Parameters:
+        - path (str): The SQLite database file.
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS vend_attempts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trx_id TEXT NOT NULL,
+                    attempt INTEGER NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    status_code INTEGER,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS ix_vend_attempts_trx_id
+                    ON vend_attempts (trx_id);
+                CREATE TABLE IF NOT EXISTS vend_results (
+                    trx_id TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    completed_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        """Return this thread's connection to the ledger."""
+        # Connections are per thread, and never reused across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def start_attempt(self, trx_id, attempt, idempotency_key):
+        """
+        Record that an attempt is about to be sent.
+
+        Parameters:
+        - trx_id (str): The transaction ID.
+        - attempt (int): The attempt number, starting at 1.
+        - idempotency_key (str): The key sent with the attempt.
+
+        Returns:
+        - int: The id of the attempt row.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO vend_attempts "
+                "(trx_id, attempt, idempotency_key, started_at) "
+                "VALUES (?, ?, ?, ?)",
+                (trx_id, attempt, idempotency_key, time.time()))
+            return cursor.lastrowid
+
+    def finish_attempt(self, attempt_id, status_code=None, error=None):
+        """
+        Record the outcome of an attempt.
+
+        Parameters:
+        - attempt_id (int): The id returned by start_attempt.
+        - status_code (int): The HTTP status received, if any.
+        - error (str): The error raised, if any.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE vend_attempts SET status_code = ?, error = ? "
+                "WHERE id = ?",
+                (status_code, error, attempt_id))
+
+    def record_result(self, trx_id, response):
+        """
+        Store the response of a vend the vendor accepted.
+
+        Parameters:
+        - trx_id (str): The transaction ID.
+        - response (dict): The JSON response from the vend execution.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO vend_results "
+                "(trx_id, response, completed_at) VALUES (?, ?, ?)",
+                (trx_id, json.dumps(response), time.time()))
+
+    def get_result(self, trx_id):
+        """
+        Return the stored response of an accepted vend.
+
+        Parameters:
+        - trx_id (str): The transaction ID.
+
+        Returns:
+        - dict: The stored response, or None if the vend never succeeded.
+        """
+        row = self._connect().execute(
+            "SELECT response FROM vend_results WHERE trx_id = ?",
+            (trx_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def attempts(self, trx_id):
+        """
+        Return the attempts made for a transaction.
+
+        Parameters:
+        - trx_id (str): The transaction ID.
+
+        Returns:
+        - list: One dict per attempt, oldest first.
+        """
+        rows = self._connect().execute(
+            "SELECT attempt, idempotency_key, started_at, status_code, error "
+            "FROM vend_attempts WHERE trx_id = ? ORDER BY id",
+            (trx_id,)).fetchall()
+        keys = ("attempt", "idempotency_key", "started_at", "status_code",
+                "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+_attempt_log = None
+_attempt_log_lock = threading.Lock()
+
+
+def get_attempt_log():
+    """
+    Return the process-wide VendAttemptLog, creating it on first use.
+
+    Returns:
+    - VendAttemptLog: The ledger stored at VEND_ATTEMPTS_DB.
+    """
+    global _attempt_log
+
+    if _attempt_log is None:
+        with _attempt_log_lock:
+            if _attempt_log is None:
+                _attempt_log = VendAttemptLog()
+    return _attempt_log
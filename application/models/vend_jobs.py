@@ -0,0 +1,406 @@
+"""This module runs vend executions in the background after payment."""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from .vend_attempts import get_attempt_log
+
+# Load environment variables from .env
+load_dotenv()
+
+VEND_JOBS_DB = os.getenv("VEND_JOBS_DB", "vend_jobs.db")
+VEND_WORKERS = int(os.getenv("VEND_WORKERS", "4"))
+VEND_JOB_ATTEMPTS = int(os.getenv("VEND_JOB_ATTEMPTS", "5"))
+# Seconds after which a running job whose worker died is picked up again.
+VEND_JOB_LEASE = float(os.getenv("VEND_JOB_LEASE", "300"))
+
+# Payload fields that must match for an enqueue to count as a repeat.
+_SAME_PURCHASE_FIELDS = ("payment_id", "customer_account_number",
+                         "usd_amount", "vertical_id")
+
+
+class DuplicateTransactionError(Exception):
+    """Raised when a trx_id is already queued for a different payment."""
+
+    def __init__(self, trx_id, job_id):
+        self.trx_id = trx_id
+        self.job_id = job_id
+        super().__init__(
+            f"Transaction {trx_id} is already queued as job {job_id} "
+            "for a different payment.")
+
+
+class VendJobQueue:
+    """
+    A durable queue of vend executions stored in SQLite.
+
+    Jobs survive worker restarts, and every gunicorn worker can pull from
+    the same file: claiming a job is a single write transaction, so a job
+    is only ever handed to one worker at a time.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, path=VEND_JOBS_DB, max_attempts=VEND_JOB_ATTEMPTS,
+                 lease=VEND_JOB_LEASE):
+        """
+        Initialize the queue, creating its table if needed.
+
+        Parameters:
+        - path (str): The SQLite database file.
+        - max_attempts (int): Attempts before a job is marked failed.
+        - lease (float): Seconds a claimed job stays reserved.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS vend_jobs (
+                    id TEXT PRIMARY KEY,
+                    trx_id TEXT NOT NULL UNIQUE,
+                    payment_id TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_at REAL NOT NULL,
+                    last_error TEXT,
+                    response TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_vend_jobs_status_run_at
+                    ON vend_jobs (status, run_at);
+                CREATE TABLE IF NOT EXISTS vend_callbacks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trx_id TEXT NOT NULL,
+                    status TEXT,
+                    payload TEXT NOT NULL,
+                    received_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_vend_callbacks_trx_id
+                    ON vend_callbacks (trx_id);
+            """)
+            columns = {row["name"] for row in
+                       conn.execute("PRAGMA table_info(vend_jobs)")}
+            if "payment_id" not in columns:
+                # Queues created before payments were recorded.
+                conn.execute(
+                    "ALTER TABLE vend_jobs ADD COLUMN payment_id TEXT")
+
+    def _connect(self):
+        """Return this thread's connection to the queue."""
+        # Connections are per thread, and never reused across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, payload):
+        """
+        Add a vend execution to the queue.
+
+        Enqueuing the same purchase twice (e.g. the PayPal return page being
+        reloaded) returns the existing job instead of vending again. A
+        purchase is the same when its trx_id, payment_id, account, amount
+        and vertical all match.
+
+        Parameters:
+        - payload (dict): The vend_execute arguments, including trx_id,
+                plus the payment_id of the captured payment.
+
+        Returns:
+        - str: The job id.
+
+        Raises:
+        - DuplicateTransactionError: If the trx_id is already queued for a
+                different payment; its vend would otherwise be lost.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR IGNORE INTO vend_jobs "
+            "(id, trx_id, payment_id, payload, status, run_at, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (uuid.uuid4().hex, payload["trx_id"], payload.get("payment_id"),
+             json.dumps(payload), self.QUEUED, now, now, now))
+        row = conn.execute(
+            "SELECT id, payment_id, payload FROM vend_jobs WHERE trx_id = ?",
+            (payload["trx_id"],)).fetchone()
+        existing = json.loads(row["payload"])
+        existing["payment_id"] = row["payment_id"]
+        if any(existing.get(field) != payload.get(field)
+               for field in _SAME_PURCHASE_FIELDS):
+            raise DuplicateTransactionError(payload["trx_id"], row["id"])
+        return row["id"]
+
+    def claim(self):
+        """
+        Reserve the next job that is due.
+
+        Returns:
+        - dict: The job, with its payload decoded, or None if none is due.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM vend_jobs "
+                "WHERE (status = ? AND run_at <= ?) "
+                "OR (status = ? AND run_at <= ?) "
+                "ORDER BY run_at LIMIT 1",
+                (self.QUEUED, now, self.RUNNING, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            # While running, run_at holds the lease expiry.
+            conn.execute(
+                "UPDATE vend_jobs SET status = ?, attempts = attempts + 1, "
+                "run_at = ?, updated_at = ? WHERE id = ?",
+                (self.RUNNING, now + self.lease, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job["attempts"] += 1
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def complete(self, job_id, response):
+        """
+        Mark a job as succeeded.
+
+        Parameters:
+        - job_id (str): The job id.
+        - response (dict): The JSON response from the vend execution.
+        """
+        self._connect().execute(
+            "UPDATE vend_jobs SET status = ?, response = ?, last_error = NULL,"
+            " updated_at = ? WHERE id = ?",
+            (self.SUCCEEDED, json.dumps(response), time.time(), job_id))
+
+    def fail(self, job_id, attempts, error, response=None):
+        """
+        Record a failed attempt, scheduling a retry if attempts remain.
+
+        Parameters:
+        - job_id (str): The job id.
+        - attempts (int): The attempts made so far.
+        - error (str): What went wrong.
+        - response (dict): The vendor response, if one was received.
+        """
+        now = time.time()
+        if attempts >= self.max_attempts:
+            status, run_at = self.FAILED, now
+        else:
+            status, run_at = self.QUEUED, now + min(300, 2 ** attempts)
+        self._connect().execute(
+            "UPDATE vend_jobs SET status = ?, run_at = ?, last_error = ?, "
+            "response = ?, updated_at = ? WHERE id = ?",
+            (status, run_at, error,
+             json.dumps(response) if response is not None else None,
+             now, job_id))
+
+    def record_callbacks(self, callbacks):
+        """
+        Store delivery confirmations sent by the vendor.
+
+        All callbacks are written in one transaction, so a burst of
+        confirmations costs a single commit. Callbacks for a trx_id that no
+        job uses are skipped; the others are still stored.
+
+        Parameters:
+        - callbacks (list): (trx_id, status, payload) tuples, where payload
+                is the decoded callback body.
+
+        Returns:
+        - tuple: (stored, unknown) - the number of callbacks stored, and
+                the trx_ids skipped because no job uses them.
+        """
+        now = time.time()
+        trx_ids = list({trx_id for trx_id, _, _ in callbacks})
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            known = set()
+            # Stay under SQLite's limit on bound parameters.
+            for start in range(0, len(trx_ids), 500):
+                chunk = trx_ids[start:start + 500]
+                known.update(row[0] for row in conn.execute(
+                    "SELECT trx_id FROM vend_jobs WHERE trx_id IN (%s)"
+                    % ", ".join("?" * len(chunk)), chunk))
+            rows = [(trx_id, status, json.dumps(payload), now)
+                    for trx_id, status, payload in callbacks
+                    if trx_id in known]
+            conn.executemany(
+                "INSERT INTO vend_callbacks "
+                "(trx_id, status, payload, received_at) VALUES (?, ?, ?, ?)",
+                rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows), [trx_id for trx_id in trx_ids
+                           if trx_id not in known]
+
+    def get(self, job_id):
+        """
+        Return a job's status.
+
+        Parameters:
+        - job_id (str): The job id.
+
+        Returns:
+        - dict: The job's id, trx_id, status, attempts, last_error, decoded
+                response and the delivery_status from the latest vendor
+                callback, or None if there is no such job.
+        """
+        row = self._connect().execute(
+            "SELECT id, trx_id, status, attempts, last_error, response, "
+            "(SELECT status FROM vend_callbacks c "
+            " WHERE c.trx_id = vend_jobs.trx_id "
+            " ORDER BY c.id DESC LIMIT 1) AS delivery_status "
+            "FROM vend_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["response"] = (json.loads(job["response"])
+                           if job["response"] else None)
+        return job
+
+
+class VendWorkerPool:
+    """
+    A pool of threads that execute queued vends.
+    """
+
+    def __init__(self, queue, vendor, workers=VEND_WORKERS,
+                 poll_interval=0.5, attempt_log=None):
+        """
+        Initialize the pool.
+
+        Parameters:
+        - queue (VendJobQueue): The queue to pull jobs from.
+        - vendor (ServiceVendor): The client used to execute vends.
+        - workers (int): The number of worker threads.
+        - poll_interval (float): Seconds to sleep when the queue is empty.
+        - attempt_log (VendAttemptLog): The ledger telling whether the
+                vendor accepted a vend. Defaults to the shared ledger.
+        """
+        self.queue = queue
+        self.vendor = vendor
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.attempt_log = attempt_log
+        self._started_pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def ensure_started(self):
+        """
+        Start the worker threads once per process.
+
+        Threads do not survive a fork, so this is called lazily from each
+        gunicorn worker rather than at import time.
+        """
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+            for number in range(self.workers):
+                threading.Thread(
+                    target=self._run, name=f"vend-worker-{number}",
+                    daemon=True).start()
+
+    def notify(self):
+        """Wake idle workers after a job has been enqueued."""
+        self._wakeup.set()
+
+    def _run(self):
+        """Execute jobs until the process exits."""
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"Error claiming vend job: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self.run_job(job)
+            except Exception as e:
+                # Keep the thread alive. The job's lease expires and it is
+                # claimed again; the attempt log keeps the retry from
+                # vending twice.
+                print(f"Error running vend job {job['id']}: {str(e)}")
+
+    def run_job(self, job):
+        """
+        Execute one claimed job and record its outcome.
+
+        Parameters:
+        - job (dict): The job returned by VendJobQueue.claim.
+        """
+        payload = job["payload"]
+        attempt_log = (self.attempt_log if self.attempt_log is not None
+                       else get_attempt_log())
+        try:
+            response = self.vendor.vend_execute(
+                payload["trx_id"],
+                payload["customer_account_number"],
+                payload["usd_amount"],
+                payload["vertical_id"],
+                payload["delivery_method"],
+                payload["deliver_to"],
+                payload["callback"])
+        except Exception as e:
+            self.queue.fail(job["id"], job["attempts"], str(e))
+            return
+
+        # vend_execute only stores responses the vendor accepted.
+        if attempt_log.get_result(payload["trx_id"]) is not None:
+            self.queue.complete(job["id"], response)
+        else:
+            self.queue.fail(job["id"], job["attempts"],
+                            "The vendor rejected the vend.", response)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide VendJobQueue, creating it on first use.
+
+    Returns:
+    - VendJobQueue: The queue stored at VEND_JOBS_DB.
+    """
+    global _job_queue
+
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = VendJobQueue()
+    return _job_queue
@@ -2,13 +2,12 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 import os
 from application.models.send_email import send_email
 from application.models.random_password import random_password
-from db_handler import Database
+from application.models.password_hasher import get_hasher
+from application.models.email_filter import get_email_filter
+from db_pool import get_db
 
 password_reset_bp = Blueprint('forgot_password', __name__)
 
-# Initialize the database connection
-db = Database()
-
 
 @password_reset_bp.route('/forgot_password', methods=['POST', 'GET'])
 def forgot_password():
@@ -28,17 +27,20 @@ def forgot_password():
     if request.method == 'POST':
         email = request.form.get('email')
 
-        # Check if the email exists in the database
-        user_data = db.find_user_by_email(email)
-        print(user_data)
+        # Check if the email exists, skipping the query for unknown ones
+        user_id = None
+        if get_email_filter().might_contain(email):
+            db = get_db()
+            user_id = db.find_user_id_by_email(email)
 
-        if user_data:
+        if user_id is not None:
             # Generate a temporary password
             temporary_password = random_password()
 
             # Update the user's password in the database with the temporary
             # password
-            if db.update_user_password(user_data['id'], temporary_password):
+            if db.update_user_password(
+                    user_id, get_hasher().hash(temporary_password)):
                 # Send an email with the temporary password using the existing
                 # send_email function
                 sender_email = 'info@remmittance.com'
@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify
+import hmac
+import os
+from application.models.vend_jobs import get_job_queue
+
+vendor_callback_bp = Blueprint('vendor_callback', __name__)
+
+
+@vendor_callback_bp.route('/vend_callback', methods=['POST'])
+def vend_callback():
+    """
+    Receive asynchronous vend completions from the vending API.
+
+    The body is either one callback object or a list of them. Each must
+    carry the transaction id as trxId, at the top level or under data, and
+    may carry a status. Callbacks are stored in the vend job store in a
+    single write, and the status page of the matching vend picks them up.
+
+    The request must carry VEND_CALLBACK_SECRET, either in the
+    X-Callback-Token header or as the token query parameter of the
+    callback URL (app1.py adds it to VEND_CALLBACK_URL, since the vendor
+    only calls back the URL it is given). The route is not registered
+    when the secret is unset.
+
+    Callbacks for a trxId no vend job uses are not stored and are listed
+    in the response; the others are. If none is known the answer is 404.
+
+    Returns:
+        Response: JSON with how many callbacks were recorded and the
+            unknown trxIds.
+    """
+    secret = os.getenv('VEND_CALLBACK_SECRET')
+    token = (request.headers.get('X-Callback-Token')
+             or request.args.get('token', ''))
+    if not secret or not hmac.compare_digest(token.encode('utf-8'),
+                                             secret.encode('utf-8')):
+        return jsonify({'error': 'Invalid callback token.'}), 403
+
+    body = request.get_json(silent=True)
+    if body is None:
+        return jsonify({'error': 'Expected a JSON body.'}), 400
+
+    callbacks = []
+    for item in body if isinstance(body, list) else [body]:
+        data = item.get('data', item) if isinstance(item, dict) else {}
+        trx_id = data.get('trxId') if isinstance(data, dict) else None
+        if not trx_id:
+            return jsonify({'error': 'Callback without trxId.'}), 400
+        callbacks.append((trx_id, data.get('status'), item))
+
+    received, unknown = get_job_queue().record_callbacks(callbacks)
+    if not received:
+        return jsonify({'error': 'Unknown trxId.', 'unknown': unknown}), 404
+
+    return jsonify({'received': received, 'unknown': unknown})
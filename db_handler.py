@@ -1,18 +1,77 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 import mysql.connector
+from mysql.connector import errors
 from dotenv import load_dotenv
+import query_stats
+
+# Prepared statements cached per connection, and how often the cache hit.
+STATEMENT_CACHE_SIZE = 32
+_statement_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_statement_stats_lock = threading.Lock()
+
+# Client error codes meaning the server connection is gone:
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST and CR_SERVER_LOST_EXTENDED.
+DISCONNECT_ERRNOS = frozenset((2006, 2013, 2055))
+# Server error code for a duplicate key in a UNIQUE index.
+ER_DUP_ENTRY = 1062
+
+
+class DuplicateEntryError(Exception):
+    """Raised when a write violates a UNIQUE index."""
 
 
 class Database:
     """
     A class for handling database operations using MariaDB.
+
+    Every operation opens its own short-lived cursor, and operations on the
+    same connection are serialized by a lock, so an instance shared between
+    threads never mixes up result sets. For real concurrency give each
+    request its own pooled instance (see db_pool.get_db).
+
+    Connections dropped by the server (e.g. after wait_timeout) are
+    re-established automatically. Reads are retried on the new connection;
+    writes are not, since they may already have been applied.
+
+    With prepared statements enabled, each connection keeps the server-side
+    statements it has prepared, keyed by SQL text, and re-executes them
+    without sending or parsing the SQL again.
+
+    Statements run inside transaction() are committed together when the
+    block exits instead of one by one.
+
+    Every query is timed and counted in query_stats, which also keeps the
+    slow-query log.
     """
 
-    def __init__(self):
+    def __init__(self, pool=None, read_retries=None, prepared=None):
         """
         Initialize the database connection using configuration from .env file.
+
+        Args:
+            pool (ConnectionPool): If given, the connection is borrowed from
+                this pool and returned to it by close() instead of opening
+                a dedicated connection.
+            read_retries (int): How many times a read is retried after a
+                lost connection. Defaults to DB_READ_RETRIES or 2.
+            prepared (bool): Run queries as cached server-side prepared
+                statements. Defaults to DB_PREPARED_STATEMENTS=1 in .env.
         """
         load_dotenv()  # load the environment variables
+        self.pool = pool
+        self.lock = threading.RLock()
+        self._in_transaction = False
+        self.read_retries = (read_retries if read_retries is not None
+                             else int(os.getenv('DB_READ_RETRIES', '2')))
+        self.prepared = (prepared if prepared is not None
+                         else os.getenv('DB_PREPARED_STATEMENTS') == '1')
+        if pool is not None:
+            self.conn = pool.acquire()
+            return
+
         host = os.getenv('DB_HOST')
         user = os.getenv('DB_USER')
         password = os.getenv('DB_PASSWORD')
@@ -28,14 +87,350 @@ class Database:
             password=password,
             database=database
         )
-        self.cursor = self.conn.cursor(dictionary=True)
+
+    @contextmanager
+    def _cursor(self, dictionary=True):
+        """
+        Hold the connection and yield a cursor for a single operation.
+
+        Args:
+            dictionary (bool): Return rows as dicts instead of tuples.
+
+        Yields:
+            MySQLCursor: A cursor closed when the block exits.
+        """
+        with self.lock:
+            self._ensure_connection()
+            cursor = self.conn.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+            finally:
+                self._close_cursor(cursor)
+
+    @contextmanager
+    def _statement(self, query, dictionary=True):
+        """
+        Hold the connection and yield a cursor ready to run `query`.
+
+        Without prepared statements this is a fresh cursor. With them, the
+        connection's cached prepared cursor for the same SQL is reused, and
+        the SQL string it was prepared with is yielded too: the driver only
+        skips re-preparing when handed that very string object.
+
+        Args:
+            query (str): The SQL query to execute.
+            dictionary (bool): Return rows as dicts instead of tuples.
+
+        Yields:
+            tuple: (cursor, query) to call cursor.execute(query, params).
+        """
+        if not self.prepared:
+            with self._cursor(dictionary=dictionary) as cursor:
+                yield cursor, query
+            return
+
+        with self.lock:
+            self._ensure_connection()
+            cache = getattr(self.conn, 'statement_cache', None)
+            if cache is None:
+                cache = self.conn.statement_cache = {}
+            key = (query, dictionary)
+            entry = cache.pop(key, None)
+            hit = entry is not None
+            if not hit:
+                cursor = self.conn.cursor(prepared=True,
+                                          dictionary=dictionary)
+                entry = (cursor, query)
+            # Re-inserting keeps the dict ordered from least to most recent.
+            cache[key] = entry
+            evicted = []
+            while len(cache) > STATEMENT_CACHE_SIZE:
+                evicted.append(cache.pop(next(iter(cache))))
+            with _statement_stats_lock:
+                _statement_stats['hits' if hit else 'misses'] += 1
+                _statement_stats['evictions'] += len(evicted)
+            for cursor, _ in evicted:
+                self._close_cursor(cursor)
+            try:
+                yield entry
+            except Exception:
+                # The statement may be unusable now; prepare it afresh.
+                cache.pop(key, None)
+                self._close_cursor(entry[0])
+                raise
+
+    def _ensure_connection(self):
+        """Check out a new connection if a failed reconnect left none."""
+        if self.conn is None and self.pool is not None:
+            self.conn = self.pool.acquire()
+
+    @staticmethod
+    def _close_cursor(cursor):
+        """Close a cursor, ignoring errors from a dead connection."""
+        try:
+            cursor.close()
+        except errors.Error:
+            pass
+
+    @staticmethod
+    def statement_cache_stats():
+        """
+        Return prepared statement cache counters for this process.
+
+        Returns:
+            dict: The number of cache hits, misses and evictions.
+        """
+        with _statement_stats_lock:
+            return dict(_statement_stats)
+
+    def _is_disconnect(self, error):
+        """
+        Tell whether an error means the connection to the server is lost.
+
+        Args:
+            error (Exception): The error raised by the driver.
+
+        Returns:
+            bool: True if reconnecting may help.
+        """
+        if not isinstance(error, (errors.OperationalError,
+                                  errors.InterfaceError)):
+            return False
+        if getattr(error, 'errno', None) in DISCONNECT_ERRNOS:
+            return True
+        if self.conn is None:
+            return True
+        try:
+            return not self.conn.is_connected()
+        except errors.Error:
+            return True
+
+    def reconnect(self, attempts=3, delay=0.5):
+        """
+        Replace the current connection with a fresh one.
+
+        Args:
+            attempts (int): How many times to try connecting.
+            delay (float): Seconds to wait between attempts.
+        """
+        with self.lock:
+            if self.pool is not None:
+                if self.conn is not None:
+                    self.pool.invalidate(self.conn)
+                # Forget the discarded connection first: if acquire()
+                # fails, close() must not hand it back a second time.
+                self.conn = None
+                self.conn = self.pool.acquire()
+            else:
+                # Statements prepared on the old session are gone.
+                getattr(self.conn, 'statement_cache', {}).clear()
+                self.conn.reconnect(attempts=attempts, delay=delay)
+
+    def ping(self):
+        """
+        Check that the database answers, reconnecting once if needed.
+
+        This is a cheap health probe: it costs a single round trip and
+        runs no query.
+
+        Returns:
+            bool: True if the database is reachable.
+        """
+        with self.lock:
+            try:
+                if self.conn is not None:
+                    self.conn.ping(reconnect=False)
+                    return True
+            except errors.Error:
+                pass
+            try:
+                self.reconnect(attempts=1)
+                self.conn.ping(reconnect=False)
+                return True
+            except errors.Error as e:
+                print(f"Error: {str(e)}")
+                return False
+
+    def _rollback(self):
+        """Roll back the current transaction, ignoring a dead connection."""
+        if self.conn is None:
+            return
+        try:
+            self.conn.rollback()
+        except errors.Error:
+            pass
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group the statements run in the block into a single transaction.
+
+        The transaction is committed when the block exits and rolled back
+        if it raises. Nested blocks join the outermost transaction. Note
+        that execute_query still reports errors by returning False; raise
+        in the block to abandon the transaction.
+
+        Yields:
+            Database: This instance.
+        """
+        with self.lock:
+            if self._in_transaction:
+                yield self
+                return
+            self._in_transaction = True
+            try:
+                yield self
+                self.conn.commit()
+            except BaseException as e:
+                if isinstance(e, Exception) and self._is_disconnect(e):
+                    # The transaction died with the connection.
+                    try:
+                        self.reconnect()
+                    except errors.Error:
+                        pass
+                else:
+                    self._rollback()
+                raise
+            finally:
+                self._in_transaction = False
+
+    def execute_many(self, query, rows, chunk_size=None):
+        """
+        Execute a SQL statement once for each parameter tuple, in chunks.
+
+        For INSERT ... VALUES statements the driver sends each chunk as a
+        single multi-row INSERT. Each chunk is committed in its own
+        transaction, so a failure leaves the earlier chunks written; inside
+        transaction() the caller's transaction governs instead. Keep chunks
+        small enough for the server's max_allowed_packet.
+
+        Args:
+            query (str): The SQL statement, e.g. an INSERT with %s markers.
+            rows (iterable): Parameter tuples; may be a generator.
+            chunk_size (int): Rows per statement and commit. Defaults to
+                DB_BATCH_SIZE or 500.
+
+        Returns:
+            int: The number of rows affected.
+
+        Raises:
+            DuplicateEntryError: If a chunk violates a UNIQUE index.
+            mysql.connector.Error: If a chunk fails otherwise.
+        """
+        chunk_size = chunk_size or int(os.getenv('DB_BATCH_SIZE', '500'))
+        written = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                written += self._write_chunk(query, chunk)
+                chunk = []
+        if chunk:
+            written += self._write_chunk(query, chunk)
+        return written
+
+    def _write_chunk(self, query, chunk):
+        """Write one chunk of execute_many in its own transaction."""
+        started = time.perf_counter()
+        try:
+            with self.transaction():
+                with self._cursor() as cursor:
+                    cursor.executemany(query, chunk)
+                    rows = max(cursor.rowcount, 0)
+        except Exception as e:
+            query_stats.record(query, time.perf_counter() - started,
+                               params=chunk[0], error=e)
+            if getattr(e, 'errno', None) == ER_DUP_ENTRY:
+                raise DuplicateEntryError(str(e)) from e
+            raise
+        query_stats.record(query, time.perf_counter() - started, rows,
+                           chunk[0])
+        return rows
+
+    def _run(self, query, params=None, fetch=None, retry=False,
+             dictionary=True):
+        """
+        Execute a query on a fresh cursor and commit, unless it runs
+        inside transaction().
+
+        Args:
+            query (str): The SQL query to execute.
+            params (tuple): A tuple of parameters to be used with the query.
+            fetch (str): None, 'one' or 'all' - which rows to return, or
+                'id' for the AUTO_INCREMENT id of an inserted row.
+            retry (bool): Retry on a new connection if the connection was
+                lost. Only safe for queries without side effects.
+            dictionary (bool): Return rows as dicts instead of tuples.
+
+        Returns:
+            The fetched row(s), or None when fetch is None.
+
+        Raises:
+            DuplicateEntryError: If a write violates a UNIQUE index.
+        """
+        # A retry cannot bring back a transaction lost with the connection.
+        attempts = (self.read_retries + 1
+                    if retry and not self._in_transaction else 1)
+        for attempt in range(attempts):
+            with self.lock:
+                started = time.perf_counter()
+                try:
+                    with self._statement(query, dictionary) as (cursor, sql):
+                        if params:
+                            cursor.execute(sql, params)
+                        else:
+                            cursor.execute(sql)
+                        result = None
+                        if fetch == 'one':
+                            result = cursor.fetchone()
+                            # Drain the rest so the connection is reusable.
+                            cursor.fetchall()
+                            rows = 1 if result else 0
+                        elif fetch == 'all':
+                            result = cursor.fetchall()
+                            rows = len(result)
+                        else:
+                            rows = max(cursor.rowcount, 0)
+                            if fetch == 'id':
+                                result = cursor.lastrowid
+                    if not self._in_transaction:
+                        self.conn.commit()
+                    query_stats.record(query, time.perf_counter() - started,
+                                       rows, params)
+                    return result
+                except Exception as e:
+                    query_stats.record(query, time.perf_counter() - started,
+                                       params=params, error=e)
+                    if self._in_transaction:
+                        # transaction() rolls back or reconnects on exit.
+                        raise
+                    disconnected = self._is_disconnect(e)
+                    if not disconnected:
+                        self._rollback()
+                        if getattr(e, 'errno', None) == ER_DUP_ENTRY:
+                            raise DuplicateEntryError(str(e)) from e
+                        raise
+                    # Reconnect so the next call works, even for writes.
+                    try:
+                        self.reconnect()
+                    except errors.Error:
+                        raise e
+                    if attempt + 1 >= attempts:
+                        raise
 
     def close(self):
         """
-        Close the database connection.
+        Close the database connection, or return it to its pool.
+
+        Safe to call after a failed reconnect left no connection.
         """
-        self.cursor.close()
-        self.conn.close()
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if self.pool is not None:
+            self.pool.release(conn)
+        else:
+            conn.close()
 
     def execute_query(self, query, params=None):
         """
@@ -49,39 +444,52 @@ class Database:
             bool: True if the query was executed successfully, False otherwise.
         """
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            self.conn.commit()
+            self._run(query, params)
             return True
         except Exception as e:
             print(f"Error: {str(e)}")
-            self.conn.rollback()
             return False
 
-    def fetch_one(self, query, params=None):
+    def insert(self, query, params=None):
+        """
+        Execute an INSERT and return the id of the new row.
+
+        Args:
+            query (str): The INSERT statement to execute.
+            params (tuple): A tuple of parameters to be used with the query.
+
+        Returns:
+            int: The AUTO_INCREMENT id of the row, or None if it failed.
+
+        Raises:
+            DuplicateEntryError: If the row violates a UNIQUE index, so the
+                caller can tell "already exists" from other failures.
+        """
+        try:
+            return self._run(query, params, fetch='id')
+        except DuplicateEntryError:
+            raise
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            return None
+
+    def fetch_one(self, query, params=None, dictionary=True):
         """
         Execute a SQL query and fetch a single row.
 
         Args:
             query (str): The SQL query to execute.
             params (tuple): A tuple of parameters to be used with the query.
+            dictionary (bool): Return the row as a dict instead of a tuple.
 
         Returns:
             dict: A dictionary representing a single row from the result.
         """
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            result = self.cursor.fetchone()
-            self.conn.commit()
-            return result
+            return self._run(query, params, fetch='one', retry=True,
+                             dictionary=dictionary)
         except Exception as e:
             print(f"Error: {str(e)}")
-            self.conn.rollback()
             return None
 
     def fetch_all(self, query, params=None):
@@ -95,8 +503,78 @@ class Database:
         Returns:
             list: A list of dictionaries representing rows from the result.
         """
-        self.execute_query(query, params)
-        return self.cursor.fetchall()
+        try:
+            return self._run(query, params, fetch='all', retry=True)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            return []
+
+    def fetch_iter(self, query, params=None, batch_size=1000,
+                   dictionary=True):
+        """
+        Execute a SQL query and yield its rows as they arrive.
+
+        Rows are streamed from the server on an unbuffered cursor and read
+        `batch_size` at a time, so memory stays flat however large the
+        result is. The connection is held until the generator is exhausted
+        or closed; closing it early still reads the remaining rows off the
+        wire, so prefer a LIMIT when only the first rows are needed.
+
+        Unlike fetch_all, errors are raised rather than swallowed, so a
+        failure part way through is never mistaken for the end of the data.
+
+        Args:
+            query (str): The SQL query to execute.
+            params (tuple): A tuple of parameters to be used with the query.
+            batch_size (int): How many rows to fetch per round.
+            dictionary (bool): Yield dicts instead of tuples.
+
+        Yields:
+            dict or tuple: One row of the result.
+        """
+        with self.lock:
+            # Timed from execute to the last row, including the caller's
+            # work in between.
+            started = time.perf_counter()
+            count = 0
+            try:
+                self._ensure_connection()
+                cursor = self.conn.cursor(buffered=False,
+                                          dictionary=dictionary)
+                try:
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        count += len(rows)
+                        yield from rows
+                finally:
+                    self._close_cursor(cursor)
+                self.conn.commit()
+                query_stats.record(query, time.perf_counter() - started,
+                                   count, params)
+            except GeneratorExit:
+                # Closed early: end the read transaction all the same.
+                self._rollback()
+                query_stats.record(query, time.perf_counter() - started,
+                                   count, params)
+                raise
+            except Exception as e:
+                query_stats.record(query, time.perf_counter() - started,
+                                   count, params, e)
+                if self._is_disconnect(e):
+                    # Leave a working connection behind for the next call.
+                    try:
+                        self.reconnect()
+                    except errors.Error:
+                        pass
+                else:
+                    self._rollback()
+                raise
 
     def find_user_by_email(self, email):
         """
@@ -109,14 +587,60 @@ class Database:
             User: The User object if found, or None if not found.
         """
         query = "SELECT * FROM users WHERE email = %s"
-        self.cursor.execute(query, (email,))
-        user_data = self.cursor.fetchone()
+        user_data = self.fetch_one(query, (email,))
 
         if user_data:
             return user_data
         else:
             return None
 
+    def find_existing_emails(self, emails):
+        """
+        Find which of a batch of email addresses are already registered.
+
+        Args:
+            emails (list): The email addresses to look up.
+
+        Returns:
+            list: The matching emails as stored in the users table.
+        """
+        if not emails:
+            return []
+        placeholders = ', '.join(['%s'] * len(emails))
+        rows = self.fetch_all(
+            f"SELECT email FROM users WHERE email IN ({placeholders})",
+            tuple(emails))
+        return [row['email'] for row in rows]
+
+    def find_user_id_by_email(self, email):
+        """
+        Find the id of the user with an email address.
+
+        Args:
+            email (str): The email address of the user to search for.
+
+        Returns:
+            int: The user's id, or None if not found.
+        """
+        row = self.fetch_one(
+            "SELECT id FROM users WHERE email = %s", (email,),
+            dictionary=False)
+        return row[0] if row else None
+
+    def find_credentials_by_email(self, email):
+        """
+        Fetch just what is needed to check a user's password.
+
+        Args:
+            email (str): The email address of the user to search for.
+
+        Returns:
+            tuple: (id, password) of the user, or None if not found.
+        """
+        return self.fetch_one(
+            "SELECT id, password FROM users WHERE email = %s", (email,),
+            dictionary=False)
+
     def update_user_password(self, user_id, new_password):
         """
         Update the user's password in the database.
@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+import mysql.connector
+from dotenv import load_dotenv
+from flask import g
+from db_handler import Database
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available in time."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of MariaDB connections.
+
+    Up to `size` idle connections are kept open between checkouts. Under
+    load up to `max_overflow` extra connections are opened and closed again
+    when returned. Connections older than `recycle` seconds are replaced,
+    and with `pre_ping` each checkout verifies the connection is alive.
+    """
+
+    def __init__(self, size=5, max_overflow=10, recycle=3600, pre_ping=True,
+                 timeout=30, **connect_args):
+        """
+        Initialize the pool. Connections are opened lazily.
+
+        Args:
+            size (int): The number of idle connections kept open.
+            max_overflow (int): Extra connections allowed under load.
+            recycle (float): Maximum age of a connection in seconds.
+            pre_ping (bool): Check connections are alive on checkout.
+            timeout (float): Seconds to wait for a free connection.
+            **connect_args: Passed on to mysql.connector.connect.
+        """
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self.connect_args = connect_args
+        # Idle connections, most recently returned last.
+        self._idle = []
+        self._opened = 0
+        self._lock = threading.Lock()
+        # Notified whenever a connection is returned or a slot frees up.
+        self._available = threading.Condition(self._lock)
+
+    def _open(self):
+        """Open a new connection and stamp its creation time."""
+        conn = mysql.connector.connect(**self.connect_args)
+        conn.pool_created_at = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and free its slot, once."""
+        with self._available:
+            if getattr(conn, 'pool_discarded', False):
+                return
+            conn.pool_discarded = True
+            self._opened -= 1
+            self._available.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn):
+        """Tell whether an idle connection can be handed out."""
+        if time.monotonic() - conn.pool_created_at > self.recycle:
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self):
+        """
+        Check a connection out of the pool.
+
+        Returns:
+            MySQLConnection: An open connection.
+
+        Raises:
+            PoolTimeoutError: If every connection stays busy for `timeout`
+                seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._available:
+                while True:
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._opened < self.size + self.max_overflow:
+                        self._opened += 1
+                        conn = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            "No database connection available within "
+                            f"{self.timeout} seconds.")
+                    self._available.wait(remaining)
+
+            if conn is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._available:
+                        self._opened -= 1
+                        self._available.notify()
+                    raise
+
+            if self._is_usable(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """
+        Return a connection to the pool.
+
+        Any open transaction is rolled back. Overflow connections, and
+        connections that are no longer usable, are closed.
+
+        Args:
+            conn (MySQLConnection): A connection obtained from acquire().
+                None, or a connection already invalidated, is ignored.
+        """
+        if conn is None or getattr(conn, 'pool_discarded', False):
+            return
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._available:
+            keep = len(self._idle) < self.size
+            if keep:
+                self._idle.append(conn)
+                self._available.notify()
+        if not keep:
+            self._discard(conn)
+
+    def invalidate(self, conn):
+        """
+        Close a checked-out connection that is broken instead of returning
+        it, freeing its slot for a new one.
+
+        Args:
+            conn (MySQLConnection): A connection obtained from acquire().
+        """
+        self._discard(conn)
+
+    def dispose(self):
+        """
+        Close every idle connection.
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+
+    The pool is configured from the .env file: DB_HOST, DB_USER,
+    DB_PASSWORD and DB_NAME as for Database, plus DB_POOL_SIZE,
+    DB_POOL_MAX_OVERFLOW, DB_POOL_RECYCLE and DB_POOL_PRE_PING.
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                load_dotenv()  # load the environment variables
+                host = os.getenv('DB_HOST')
+                user = os.getenv('DB_USER')
+                password = os.getenv('DB_PASSWORD')
+                database = os.getenv('DB_NAME')
+
+                if not (host and user and password and database):
+                    raise ValueError(
+                        "Database configuration not found in the .env file.")
+
+                _pool = ConnectionPool(
+                    size=int(os.getenv('DB_POOL_SIZE', '5')),
+                    max_overflow=int(os.getenv('DB_POOL_MAX_OVERFLOW', '10')),
+                    recycle=float(os.getenv('DB_POOL_RECYCLE', '3600')),
+                    pre_ping=os.getenv('DB_POOL_PRE_PING', '1') != '0',
+                    host=host,
+                    user=user,
+                    password=password,
+                    database=database)
+    return _pool
+
+
+def _reset_pool_after_fork():
+    """Drop the inherited pool so a forked worker opens its own sockets."""
+    global _pool, _pool_lock
+
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def get_db():
+    """
+    Return the Database checked out for the current request.
+
+    The first call in an app context borrows a pooled connection; later
+    calls in the same context reuse it, and it goes back to the pool when
+    the context is torn down (see init_app).
+
+    Returns:
+        Database: The request's database handle.
+    """
+    if 'db' not in g:
+        g.db = Database(pool=get_pool())
+    return g.db
+
+
+def close_db(exception=None):
+    """
+    Return the request's connection to the pool, if one was borrowed.
+
+    Args:
+        exception (Exception): The error that ended the request, if any.
+    """
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+
+def init_app(app):
+    """
+    Register the per-request connection teardown on a Flask app.
+
+    Args:
+        app (Flask app): The Flask application instance.
+    """
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+import_users.py
+
+Register the users listed in a CSV file, for onboarding partner customer
+lists. The file needs a header row with first_name, last_name, email,
+phone and password columns (firstname/lastname are accepted too):
+
+    python import_users.py partner.csv
+    python import_users.py partner.csv --batch-size 1000 --rejects out.csv
+
+Rows are streamed, validated and normalized, and written in batches: each
+batch costs one duplicate lookup and one multi-row INSERT, with passwords
+hashed in parallel on BCRYPT_WORKERS threads. Rows that are invalid,
+repeat an email seen earlier in the file, or are already registered are
+written to the rejects file with their line number and the reason.
+Passwords are never written to it.
+"""
+import argparse
+import csv
+import re
+import sys
+import time
+
+from application.models.email_filter import normalize_email
+from application.models.registration import RegistrationManager
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_PATTERN = re.compile(r"^\+?\d{7,15}$")
+
+COLUMN_ALIASES = {
+    "firstname": "first_name",
+    "lastname": "last_name",
+}
+
+
+class RowError(ValueError):
+    """Raised when a CSV row cannot be imported."""
+
+
+def normalize_row(row):
+    """
+    Validate a CSV row and return it in the form the users table stores.
+
+    Args:
+        row (dict): The row, keyed by the normalized header names.
+
+    Returns:
+        tuple: (first_name, last_name, email, phone, password).
+
+    Raises:
+        RowError: If a field is missing or malformed.
+    """
+    first_name = (row.get("first_name") or "").strip()
+    last_name = (row.get("last_name") or "").strip()
+    email = (row.get("email") or "").strip().lower()
+    phone = re.sub(r"[\s().-]", "", row.get("phone") or "")
+    password = row.get("password") or ""
+
+    if not first_name or not last_name:
+        raise RowError("missing name")
+    if len(first_name) > 100 or len(last_name) > 100:
+        raise RowError("name too long")
+    if len(email) > 255 or not EMAIL_PATTERN.match(email):
+        raise RowError("invalid email")
+    if not PHONE_PATTERN.match(phone):
+        raise RowError("invalid phone")
+    if not password:
+        raise RowError("missing password")
+    if len(password.encode("utf-8")) > 72:
+        # bcrypt ignores anything past 72 bytes.
+        raise RowError("password longer than 72 bytes")
+    return first_name, last_name, email, phone, password
+
+
+def read_rows(f):
+    """
+    Stream the rows of a CSV file with normalized header names.
+
+    Args:
+        f (file): The open CSV file.
+
+    Yields:
+        tuple: (line_number, row) for each data row.
+    """
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [name.strip().lower().replace(" ", "_") for name in header]
+    names = [COLUMN_ALIASES.get(name, name) for name in names]
+    for row in reader:
+        if not any(field.strip() for field in row):
+            continue
+        yield reader.line_num, dict(zip(names, row))
+
+
+def import_users(f, rejects, manager, batch_size=500, progress=sys.stderr):
+    """
+    Import the users of a CSV file.
+
+    Args:
+        f (file): The open CSV file.
+        rejects (csv.writer): Receives (line, email, reason) per reject.
+        manager (RegistrationManager): Registers each batch.
+        batch_size (int): Users hashed and inserted together.
+        progress (file): Where progress lines are written.
+
+    Returns:
+        dict: Counts of rows read, users registered and rows rejected.
+    """
+    counts = {"read": 0, "registered": 0, "rejected": 0}
+    seen = set()
+    batch = []
+    started = time.monotonic()
+
+    def reject(line, email, reason):
+        rejects.writerow([line, email, reason])
+        counts["rejected"] += 1
+
+    def flush():
+        users = [user for _, user in batch]
+        try:
+            registered, duplicates = manager.register_users(users)
+        except Exception as e:
+            for line, user in batch:
+                reject(line, user[2], f"database error: {e}")
+        else:
+            registered = set(registered)
+            duplicates = set(duplicates)
+            counts["registered"] += len(registered)
+            for line, user in batch:
+                if user[2] in duplicates:
+                    reject(line, user[2], "already registered")
+                elif user[2] not in registered:
+                    reject(line, user[2], "insert failed")
+        batch.clear()
+        elapsed = time.monotonic() - started
+        print(f"{counts['read']} read, {counts['registered']} registered, "
+              f"{counts['rejected']} rejected "
+              f"({counts['read'] / elapsed:.0f} rows/s)", file=progress)
+
+    for line, row in read_rows(f):
+        counts["read"] += 1
+        email = (row.get("email") or "").strip()
+        try:
+            user = normalize_row(row)
+        except RowError as e:
+            reject(line, email, str(e))
+            continue
+        key = normalize_email(user[2])
+        if key in seen:
+            reject(line, user[2], "duplicate email in file")
+            continue
+        seen.add(key)
+        batch.append((line, user))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return counts
+
+
+def main():
+    """Parse the command line and import the file."""
+    parser = argparse.ArgumentParser(
+        description="Register the users listed in a CSV file.")
+    parser.add_argument("csv_file")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rejects", default=None,
+                        help="where to write rejected rows "
+                             "(default: <csv_file>.rejects.csv)")
+    args = parser.parse_args()
+
+    rejects_path = args.rejects or f"{args.csv_file}.rejects.csv"
+    manager = RegistrationManager(None)
+    with open(args.csv_file, newline="", encoding="utf-8-sig") as f, \
+            open(rejects_path, "w", newline="") as out:
+        rejects = csv.writer(out)
+        rejects.writerow(["line", "email", "reason"])
+        counts = import_users(f, rejects, manager, args.batch_size)
+
+    print(f"Done: {counts['registered']} registered, "
+          f"{counts['rejected']} rejected of {counts['read']} rows. "
+          f"Rejects written to {rejects_path}.")
+    return 0 if counts["rejected"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
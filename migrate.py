@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+migrate.py
+
+Apply the SQL migrations in migrations/ to the database configured in .env.
+
+Migrations are named NNNN_description.sql and run in order. Each one that
+succeeds is recorded in the schema_migrations table, so running this again
+only applies new files:
+
+    python migrate.py           # apply pending migrations
+    python migrate.py --list    # show which migrations are applied
+
+MariaDB commits DDL statements implicitly, so a migration that fails part
+way is not rolled back; write each statement so it can be re-run (IF NOT
+EXISTS), fix the cause and run the migrations again.
+"""
+import argparse
+import os
+import re
+
+from db_handler import Database
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+_MIGRATION_NAME = re.compile(r'^\d{4}_\w+\.sql$')
+
+
+def split_statements(sql):
+    """
+    Split a migration file into statements.
+
+    Statements end with a semicolon at the end of a line, and lines
+    starting with -- are comments.
+
+    Args:
+        sql (str): The contents of a migration file.
+
+    Returns:
+        list: The statements, without their trailing semicolons.
+    """
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        if line.strip().startswith('--'):
+            continue
+        current.append(line)
+        if line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip().rstrip(';').strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    statement = '\n'.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    """
+    List the migration files in order.
+
+    Args:
+        directory (str): The folder holding the .sql files.
+
+    Returns:
+        list: (version, path) tuples, where version is the file name.
+    """
+    return [(name, os.path.join(directory, name))
+            for name in sorted(os.listdir(directory))
+            if _MIGRATION_NAME.match(name)]
+
+
+def applied_migrations(db):
+    """
+    Return the versions already applied, creating the ledger if needed.
+
+    Args:
+        db (Database): The database to migrate.
+
+    Returns:
+        set: The applied migration file names.
+    """
+    cursor = db.conn.cursor()
+    try:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version VARCHAR(255) NOT NULL PRIMARY KEY, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def migrate(db, directory=MIGRATIONS_DIR):
+    """
+    Apply every pending migration in order.
+
+    Args:
+        db (Database): The database to migrate.
+        directory (str): The folder holding the .sql files.
+
+    Returns:
+        list: The versions applied by this run.
+
+    Raises:
+        mysql.connector.Error: If a statement fails; later migrations are
+            not attempted.
+    """
+    done = applied_migrations(db)
+    applied = []
+    for version, path in available_migrations(directory):
+        if version in done:
+            continue
+        with open(path) as f:
+            statements = split_statements(f.read())
+        cursor = db.conn.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s)",
+                (version,))
+            db.conn.commit()
+        except Exception:
+            db.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        print(f"Applied {version}")
+        applied.append(version)
+    return applied
+
+
+def main():
+    """Parse the command line and migrate the database."""
+    parser = argparse.ArgumentParser(
+        description="Apply the SQL migrations in migrations/.")
+    parser.add_argument("--list", action="store_true",
+                        help="show migration status instead of migrating")
+    parser.add_argument("--dir", default=MIGRATIONS_DIR)
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        if args.list:
+            done = applied_migrations(db)
+            for version, _ in available_migrations(args.dir):
+                state = "applied" if version in done else "pending"
+                print(f"{state:8} {version}")
+            return
+        if not migrate(db, args.dir):
+            print("Database is up to date.")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
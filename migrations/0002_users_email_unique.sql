@@ -0,0 +1,8 @@
+-- Login and registration look users up by email: make that an index seek,
+-- and let the database reject duplicate emails.
+-- On a hand-created table this fails if duplicate emails already exist;
+-- find them with:
+--   SELECT email, COUNT(*) FROM users GROUP BY email HAVING COUNT(*) > 1;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_users_email ON users (email);
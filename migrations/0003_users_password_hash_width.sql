@@ -0,0 +1,3 @@
+-- Passwords are stored as bcrypt hashes (60 characters). Widen the column
+-- on tables created by hand before migrations with a shorter one.
+ALTER TABLE users MODIFY password VARCHAR(255) NOT NULL;
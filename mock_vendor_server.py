@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+mock_vendor_server.py
+
+A local stand-in for the vending API, for load testing and benchmarks.
+
+It serves /auth, /vend/validate and /vend/execute with the response shapes
+that ServiceVendor and app1.py read, and can add latency, errors and short
+token lifetimes. Point the app at it with, for example:
+
+    python mock_vendor_server.py --port 8081 --latency-ms 80 --error-rate 0.02
+    AIRTIME_BASE_URL=http://127.0.0.1:8081 gunicorn app1:app
+
+"""
+import argparse
+import math
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+
+class MockVendorConfig:
+    """Behaviour knobs of the mock vending API."""
+
+    def __init__(self, latency_ms=50, latency_dist="fixed", jitter_ms=0,
+                 error_rate=0.0, timeout_rate=0.0, timeout_ms=60000,
+                 token_ttl=600, api_key=None, api_secret=None):
+        """
+        Initialize the configuration.
+
+        Args:
+            latency_ms (float): Mean added latency per request.
+            latency_dist (str): fixed, uniform, normal or lognormal.
+            jitter_ms (float): Spread of the latency distribution.
+            error_rate (float): Fraction of vend requests answered with 503.
+            timeout_rate (float): Fraction of vend requests that hang.
+            timeout_ms (float): How long a hanging request sleeps.
+            token_ttl (float): Lifetime in seconds of issued tokens.
+            api_key (str): The API key /auth accepts; any if None.
+            api_secret (str): The API secret /auth accepts; any if None.
+        """
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_ms = timeout_ms
+        self.token_ttl = token_ttl
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+    def sample_latency(self):
+        """
+        Draw the latency of one request.
+
+        Returns:
+            float: The latency in seconds.
+        """
+        mean, spread = self.latency_ms, self.jitter_ms
+        if self.latency_dist == "uniform":
+            value = random.uniform(mean - spread, mean + spread)
+        elif self.latency_dist == "normal":
+            value = random.gauss(mean, spread)
+        elif self.latency_dist == "lognormal" and mean > 0:
+            # Parameters chosen so the distribution has the given mean and
+            # standard deviation, which gives the long tail seen in prod.
+            variance = spread ** 2
+            sigma2 = math.log(1 + variance / mean ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            value = random.lognormvariate(mu, sigma2 ** 0.5)
+        else:
+            value = mean
+        return max(0, value) / 1000
+
+
+def create_app(config=None):
+    """
+    Create the mock vending API application.
+
+    Args:
+        config (MockVendorConfig): The behaviour of the mock.
+
+    Returns:
+        Flask: The application.
+    """
+    config = config or MockVendorConfig()
+    app = Flask(__name__)
+    lock = threading.Lock()
+    tokens = {}
+    transactions = {}
+    executions = {}
+    stats = {"auth": 0, "validate": 0, "execute": 0, "unauthorized": 0,
+             "errors": 0, "timeouts": 0, "replayed": 0, "double_vends": 0}
+
+    def count(name):
+        with lock:
+            stats[name] += 1
+
+    def simulate_network():
+        """Sleep, fail or hang as configured. Returns an error response."""
+        roll = random.random()
+        if roll < config.timeout_rate:
+            count("timeouts")
+            time.sleep(config.timeout_ms / 1000)
+        time.sleep(config.sample_latency())
+        if roll >= config.timeout_rate and (
+                roll < config.timeout_rate + config.error_rate):
+            count("errors")
+            return jsonify({"message": "Service temporarily unavailable"}), 503
+        return None
+
+    def authorized():
+        header = request.headers.get("Authorization", "")
+        token = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+        with lock:
+            expires_at = tokens.get(token)
+        if expires_at is None or expires_at < time.time():
+            count("unauthorized")
+            return False
+        return True
+
+    @app.route("/auth", methods=["POST"])
+    def auth():
+        count("auth")
+        time.sleep(config.sample_latency())
+        body = request.get_json(silent=True) or {}
+        if ((config.api_key and body.get("api_key") != config.api_key) or
+                (config.api_secret and
+                 body.get("api_secret") != config.api_secret)):
+            return jsonify({"message": "Invalid credentials"}), 401
+        token = uuid.uuid4().hex
+        with lock:
+            now = time.time()
+            for stale in [t for t, exp in tokens.items() if exp < now]:
+                del tokens[stale]
+            tokens[token] = now + config.token_ttl
+        return jsonify({"data": {"accessToken": token,
+                                 "expiresIn": config.token_ttl}})
+
+    @app.route("/vend/validate", methods=["POST"])
+    def vend_validate():
+        count("validate")
+        if not authorized():
+            return jsonify({"message": "Unauthorized"}), 401
+        error = simulate_network()
+        if error:
+            return error
+        body = request.get_json(silent=True) or {}
+        account = body.get("customerAccountNumber", "")
+        trx_id = uuid.uuid4().hex
+        with lock:
+            transactions[trx_id] = body
+        return jsonify({"data": {
+            "trxId": trx_id,
+            "verticalId": body.get("verticalId"),
+            "customerAccountNumber": account,
+            "deliveryMethods": [{"id": "sms", "name": "SMS"}],
+            "deliverTo": account,
+            "callback": request.host_url + "callback",
+        }})
+
+    @app.route("/vend/execute", methods=["POST"])
+    def vend_execute():
+        count("execute")
+        if not authorized():
+            return jsonify({"message": "Unauthorized"}), 401
+        error = simulate_network()
+        if error:
+            return error
+        body = request.get_json(silent=True) or {}
+        trx_id = body.get("trxId")
+        key = request.headers.get("Idempotency-Key")
+        with lock:
+            if trx_id not in transactions:
+                return jsonify({"message": "Unknown trxId"}), 404
+            previous = executions.get(trx_id)
+            if previous is not None:
+                if key and previous["key"] == key:
+                    stats["replayed"] += 1
+                    return jsonify(previous["response"])
+                stats["double_vends"] += 1
+            response = {"data": {"trxId": trx_id, "status": "successful",
+                                 "amount": body.get("amount")}}
+            executions[trx_id] = {"key": key, "response": response}
+        return jsonify(response)
+
+    @app.route("/stats", methods=["GET"])
+    def get_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    return app
+
+
+def main():
+    """Parse the command line and serve the mock."""
+    parser = argparse.ArgumentParser(
+        description="Serve a local stand-in for the vending API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--latency-dist", default="fixed",
+                        choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-ms", type=float, default=60000)
+    parser.add_argument("--token-ttl", type=float, default=600)
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--api-secret", default=None)
+    args = parser.parse_args()
+
+    config = MockVendorConfig(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_ms=args.timeout_ms,
+        token_ttl=args.token_ttl,
+        api_key=args.api_key,
+        api_secret=args.api_secret)
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""This module times the queries run through Database."""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# Set DB_QUERY_STATS=0 to turn the instrumentation off.
+ENABLED = os.getenv('DB_QUERY_STATS', '1') != '0'
+# Queries slower than this many milliseconds go to the slow-query log.
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '500'))
+# How many recent slow queries slow_queries() keeps.
+SLOW_QUERY_KEEP = int(os.getenv('DB_SLOW_QUERY_KEEP', '100'))
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger('db.slow_query')
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(query):
+    """
+    Reduce a SQL statement to its shape, so variants group together.
+
+    Literals and placeholders become ?, IN lists and multi-row VALUES
+    collapse to a single (?+), and whitespace is squeezed.
+
+    Args:
+        query (str): The SQL statement.
+
+    Returns:
+        str: The normalized statement.
+    """
+    shape = _STRING.sub('?', query)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _IN_LIST.sub('(?+)', shape)
+    shape = re.sub(r"(\(\?\+\)|\(\?\))(\s*,\s*\(\?\+?\))+", r"\1", shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def redact(params):
+    """
+    Describe query parameters without revealing their values.
+
+    Args:
+        params (tuple or dict): The query parameters.
+
+    Returns:
+        The same structure with each value replaced by its type name.
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: f'<{type(value).__name__}>'
+                for key, value in params.items()}
+    return tuple(f'<{type(value).__name__}>' for value in params)
+
+
+class StatementStats:
+    """
+    Latency histogram and row counts for one normalized statement.
+    """
+
+    def __init__(self):
+        """Initialize empty counters."""
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows, error):
+        """
+        Count one execution.
+
+        Args:
+            elapsed_ms (float): How long it took.
+            rows (int): Rows returned or affected.
+            error (bool): Whether it raised.
+        """
+        self.count += 1
+        self.errors += bool(error)
+        self.rows += rows or 0
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, percent):
+        """
+        Estimate a latency percentile from the histogram.
+
+        Args:
+            percent (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The upper bound in ms of the bucket holding it, or the
+                maximum seen for the open-ended last bucket.
+        """
+        if not self.count:
+            return None
+        wanted = percent / 100 * self.count
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= wanted:
+                break
+        if index < len(BUCKETS_MS):
+            return round(min(BUCKETS_MS[index], self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self):
+        """
+        Return the counters as plain data.
+
+        Returns:
+            dict: Counts, row totals, latency summary and histogram.
+        """
+        labels = [f'<={bound}ms' for bound in BUCKETS_MS]
+        labels.append(f'>{BUCKETS_MS[-1]}ms')
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3)
+            if self.count else None,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'histogram': dict(zip(labels, self.buckets)),
+        }
+
+
+_stats = {}
+_slow = deque(maxlen=SLOW_QUERY_KEEP)
+_lock = threading.Lock()
+
+
+def record(query, elapsed, rows=None, params=None, error=None):
+    """
+    Record one execution of a query.
+
+    Args:
+        query (str): The SQL statement as run.
+        elapsed (float): How long it took, in seconds.
+        rows (int): Rows returned or affected, if known.
+        params (tuple or dict): The parameters, only logged redacted.
+        error (Exception): The error it raised, if any.
+    """
+    if not ENABLED:
+        return
+    shape = normalize(query)
+    elapsed_ms = elapsed * 1000
+    with _lock:
+        stats = _stats.get(shape)
+        if stats is None:
+            stats = _stats[shape] = StatementStats()
+        stats.add(elapsed_ms, rows, error is not None)
+        if elapsed_ms < SLOW_QUERY_MS:
+            return
+        entry = {
+            'query': shape,
+            'params': redact(params),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'rows': rows,
+            'error': type(error).__name__ if error is not None else None,
+            'at': time.time(),
+        }
+        _slow.append(entry)
+    logger.warning("Slow query (%.1f ms, %s rows): %s params=%s",
+                   elapsed_ms, rows, shape, entry['params'])
+
+
+def snapshot():
+    """
+    Return the counters of every statement seen in this process.
+
+    Returns:
+        dict: Normalized statement -> StatementStats.as_dict(), slowest
+            total time first.
+    """
+    with _lock:
+        ordered = sorted(_stats.items(), key=lambda item: item[1].total_ms,
+                         reverse=True)
+        return {shape: stats.as_dict() for shape, stats in ordered}
+
+
+def slow_queries():
+    """
+    Return the most recent slow queries, oldest first.
+
+    Returns:
+        list: One dict per slow query, with parameters redacted.
+    """
+    with _lock:
+        return list(_slow)
+
+
+def reset():
+    """Clear all counters and the slow-query log."""
+    with _lock:
+        _stats.clear()
+        _slow.clear()
@@ -0,0 +1,72 @@
+"""Regression tests for releasing the half-open probe of a circuit breaker."""
+import asyncio
+import time
+import types
+
+import pytest
+
+from application.models.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, guarded_request)
+
+
+def half_open_breaker():
+    """Return a breaker that lets exactly one probe through."""
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+
+def test_interrupted_sync_request_releases_probe():
+    breaker = half_open_breaker()
+
+    class InterruptedSession:
+        def request(self, *args, **kwargs):
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        guarded_request(breaker, InterruptedSession(), "POST",
+                        "http://vendor/vend/validate", (1, 1))
+
+    # The next request may probe again instead of failing fast.
+    breaker.before_request()
+
+
+def test_cancelled_async_request_releases_probe():
+    pytest.importorskip("aiohttp")
+    from application.models.async_service_vendor import AsyncServiceVendor
+
+    class HangingResponse:
+        async def __aenter__(self):
+            await asyncio.sleep(60)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    class HangingSession:
+        def request(self, *args, **kwargs):
+            return HangingResponse()
+
+    breaker = half_open_breaker()
+    vendor = types.SimpleNamespace(
+        timeout=types.SimpleNamespace(sock_connect=1, sock_read=1))
+
+    async def send_with_deadline():
+        await asyncio.wait_for(
+            AsyncServiceVendor._send(
+                vendor, breaker, HangingSession(), "POST",
+                "http://vendor/vend/validate", {}, {}),
+            timeout=0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(send_with_deadline())
+
+    breaker.before_request()
+
+
+def test_probe_in_flight_still_blocks_concurrent_requests():
+    breaker = half_open_breaker()
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success(time.monotonic() - time.monotonic())
+    breaker.before_request()
@@ -0,0 +1,70 @@
+"""Tests for handing out connections from the ConnectionPool."""
+import threading
+import time
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_pool(**kwargs):
+    """Return a pool whose connections never touch a database."""
+    pool = ConnectionPool(**kwargs)
+
+    def open_fake():
+        conn = FakeConnection()
+        conn.pool_created_at = time.monotonic()
+        return conn
+
+    pool._open = open_fake
+    return pool
+
+
+def acquire_in_thread(pool):
+    """Start acquiring in another thread; return what it got and when."""
+    got = {}
+
+    def acquire():
+        got["conn"] = pool.acquire()
+        got["at"] = time.monotonic()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    return thread, got
+
+
+@pytest.mark.parametrize("give_back", ["release", "invalidate"])
+def test_waiter_is_woken_when_a_slot_frees(give_back):
+    pool = fake_pool(size=1, max_overflow=0, timeout=5)
+    conn = pool.acquire()
+    thread, got = acquire_in_thread(pool)
+    time.sleep(0.1)
+
+    freed_at = time.monotonic()
+    getattr(pool, give_back)(conn)
+    thread.join(5)
+
+    assert got["at"] - freed_at < 1
+
+
+def test_discarding_twice_frees_one_slot():
+    pool = fake_pool(size=1, max_overflow=0, timeout=0.1)
+    conn = pool.acquire()
+    pool.invalidate(conn)
+    pool.release(conn)
+    pool.invalidate(conn)
+
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
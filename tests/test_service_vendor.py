@@ -0,0 +1,58 @@
+"""Tests for validating a batch of accounts with ServiceVendor."""
+import time
+
+from application.models.service_vendor import ServiceVendor
+from application.models.ttl_cache import TTLCache
+
+
+def slow_vendor(delay):
+    """Return a vendor whose validations each take `delay` seconds."""
+    vendor = ServiceVendor.__new__(ServiceVendor)
+    vendor.timeout = (1, 5)
+
+    def vend_validate(vertical_id, customer_account_number, **kwargs):
+        time.sleep(delay)
+        return {"data": {"accountNumber": customer_account_number}}
+
+    vendor.vend_validate = vend_validate
+    return vendor
+
+
+def test_timed_out_items_do_not_end_the_batch_early():
+    vendor = slow_vendor(0.2)
+    accounts = [("airtime", str(number)) for number in range(5)]
+
+    results = list(vendor.vend_validate_many(
+        accounts, max_concurrency=1, timeout=0.05))
+
+    assert sorted(result.customer_account_number
+                  for result in results) == [str(n) for n in range(5)]
+    assert all(isinstance(result.error, TimeoutError) for result in results)
+
+
+def test_batch_without_timeout_returns_every_response():
+    vendor = slow_vendor(0)
+    accounts = [("airtime", str(number)) for number in range(20)]
+
+    results = list(vendor.vend_validate_many(accounts, max_concurrency=3))
+
+    assert len(results) == 20
+    assert all(result.error is None for result in results)
+
+
+def test_batch_validation_never_reuses_a_cached_trx_id():
+    vendor = ServiceVendor.__new__(ServiceVendor)
+    vendor.base_url = "http://vendor"
+    vendor.timeout = (1, 5)
+    vendor.validate_cache = TTLCache(maxsize=10, ttl=60)
+    vendor.validate_cache.set(("airtime", "1"), {"data": {"trxId": "used"}})
+    trx_ids = iter(["fresh-1", "fresh-2"])
+    vendor.perform_authenticated_request = (
+        lambda *args, **kwargs: {"data": {"trxId": next(trx_ids)}})
+
+    results = list(vendor.vend_validate_many(
+        [("airtime", "1"), ("airtime", "2")], max_concurrency=1))
+
+    assert [result.response["data"]["trxId"] for result in results] == [
+        "fresh-1", "fresh-2"]
+    assert vendor.validate_cache.get(("airtime", "2")) is None